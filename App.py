@@ -1,22 +1,142 @@
 import streamlit as st
 import pandas as pd
-import base64
 import os
 import io
-from fast import generate_codebook_fast  # 確保 fast.py 有放對位置並含有該函式
-from test import generate_codebook  # 確保 test.py 有放對位置並含有該函式
+import hashlib
+from streaming import iter_csv_chunks
+from cache import ReportCache
+from metadata import resolve_variables
+from jobs import JobManager, DEFAULT_WORKERS
+from shards import SHARD_MODES, DEFAULT_SHARD_SIZE
+from renderers import OUTPUT_FORMATS, mime_type
+from transforms import compile_plan, apply_plan, export_csv, to_dense, TransformPipeline
+from loaders import read_csv, clean_data, clean_code, match_variables, prepare_frame, format_memory, input_kind, columnar_columns, read_columnar, DATA_FILE_TYPES
 
 st.set_page_config(page_title="Codebook 產生器", layout="wide")
+
+# 🗃️ 跨 session 共用的統計量／圖檔快取；設定 CODEBOOK_CACHE_DIR 時同時寫入磁碟
+@st.cache_resource
+def get_report_cache():
+    return ReportCache(directory=os.environ.get("CODEBOOK_CACHE_DIR") or None)
+
+# 🐢 matplotlib／python-docx 與中文字型只在第一次產出報告時載入，之後所有 session 共用，
+#    上傳頁面不必等繪圖套件載入（匯入時間預算見 benchmark.py imports）
+@st.cache_resource
+def load_generators():
+    from test import generate_codebook  # 確保 test.py 有放對位置並含有該函式
+    from fast import generate_codebook_fast  # 確保 fast.py 有放對位置並含有該函式
+    from streaming import generate_codebook_chunked
+    return {"full": generate_codebook, "fast": generate_codebook_fast, "chunked": generate_codebook_chunked}
+
+# ⏳ 跨 session 共用的背景工作佇列；同時執行的報告數量由 CODEBOOK_JOB_WORKERS 設定
+@st.cache_resource
+def get_job_manager():
+    return JobManager(max_workers=int(os.environ.get("CODEBOOK_JOB_WORKERS", DEFAULT_WORKERS)))
+
+# 每秒只重跑這個區塊更新進度，不會重跑整個頁面；工作結束後整頁重跑一次顯示結果
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None or not job.active:
+        st.rerun()
+    status = "排隊中" if job.status == "queued" else f"{job.done}/{job.total} {job.message}"
+    st.progress(job.fraction, text=f"📄 {job.label}報告產出中：{status}")
+    if st.button("⛔ 取消產出", key=f"cancel_{job_id}"):
+        job.cancel()
+
+def show_job_result(job):
+    if job.status == "done":
+        # 📥 報告直接由記憶體緩衝區經下載端點傳給瀏覽器：不經 base64 data URI，也不寫入暫存檔；
+        #    傳入 callable 時只有按下按鈕才取出位元組，頁面 rerun 不會重複傳送整份報告
+        st.download_button(
+            f"📥 下載{job.label} Codebook 報告", data=job.data, file_name=job.file_name,
+            mime=mime_type(job.file_name),
+            on_click="ignore", key=f"download_{job.id}"
+        )
+
+        fingerprint_buffer = st.session_state.get("codebook_fingerprint")
+        if fingerprint_buffer is not None:
+            st.download_button(
+                "📥 下載指紋檔（下次更新模式使用）", data=fingerprint_buffer.getvalue(),
+                file_name="codebook.fingerprint.json", mime="application/json"
+            )
+
+        st.success(f"✅ {job.label}報告產出完成！")
+    elif job.status == "cancelled":
+        st.warning(f"⛔ {job.label}報告產出已取消")
+    else:
+        st.error(f"❌ {job.label}報告產出失敗：{job.error}")
+
+# 🔑 上傳檔的內容雜湊：每個上傳檔（file_id）只算一次，之後的 rerun 直接沿用
+def upload_key(uploaded_file):
+    hashes = st.session_state.setdefault("upload_hashes", {})
+    file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+    if file_id not in hashes:
+        hashes[file_id] = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+    return hashes[file_id]
+
+# 📦 解析結果依內容雜湊快取：按按鈕或調整選項造成的 rerun 不會重新解碼整份 CSV；
+#    與 prepare_dataset 相同用 cache_resource，每次 rerun 直接共用同一份 DataFrame（不會被修改），不必反序列化複製
+@st.cache_resource(max_entries=8, show_spinner="📖 讀取 CSV 中...")
+def parse_uploaded_csv(content_key, _uploaded_file):
+    # 先由檔頭樣本判斷編碼，只完整解析一次（見 loaders.read_csv）
+    try:
+        return read_csv(_uploaded_file)
+    except Exception:
+        return None
+
+# 🧊 Parquet／Feather／Arrow：只讀指定欄位（columns=None 為全部），nrows 只讀前幾列做預覽
+@st.cache_resource(max_entries=8, show_spinner="📖 讀取資料中...")
+def parse_uploaded_columnar(content_key, kind, columns, nrows, _uploaded_file):
+    return read_columnar(_uploaded_file, kind, columns=columns, nrows=nrows)
+
+def read_uploaded_columnar(uploaded_file, kind, columns=None, nrows=None):
+    try:
+        return parse_uploaded_columnar(upload_key(uploaded_file), kind, columns, nrows, uploaded_file)
+    except Exception as e:
+        st.error(f"❌ 檔案無法讀取，請確認是否為有效的 Parquet／Feather／Arrow 檔案：{e}")
+        return None
+
+def uploaded_columns(uploaded_file, kind):
+    # 欄式檔案的完整欄位清單（只讀 schema），用於與 code.csv 比對
+    names = [str(name).strip() for name in columnar_columns(uploaded_file, kind)]
+    return [name for name in names if not name.startswith("Unnamed")]
+
 # ✅ 🚨 請確保這段放在所有 tab1/tab2 之前！
 def read_uploaded_csv(uploaded_file):
-    for enc in ["utf-8", "utf-8-sig", "cp950", "big5"]:
-        try:
-            return pd.read_csv(io.TextIOWrapper(uploaded_file, encoding=enc))
-        except Exception:
-            uploaded_file.seek(0)
-            continue
-    st.error("❌ 檔案無法讀取，請確認是否為有效的 CSV 並使用常見編碼（UTF-8、BIG5、CP950）")
-    return None
+    df = parse_uploaded_csv(upload_key(uploaded_file), uploaded_file)
+    if df is None:
+        st.error("❌ 檔案無法讀取，請確認是否為有效的 CSV 並使用常見編碼（UTF-8、BIG5、CP950）")
+    return df
+
+# 🧩 code.csv 與主資料的變數比對、類型與 X/Y 角色解析，依兩個檔案的內容雜湊快取
+@st.cache_data(max_entries=16)
+def resolve_codebook(data_key, code_key, _df_columns, _code_df):
+    code_df, common_vars, excluded_vars, excluded_code_vars = match_variables(_df_columns, _code_df)
+    column_types, variable_names, column_roles, warnings = resolve_variables(code_df, _df_columns)
+    return {
+        "code_df": code_df, "common_vars": common_vars,
+        "excluded_vars": excluded_vars, "excluded_code_vars": excluded_code_vars,
+        "column_types": column_types, "variable_names": variable_names,
+        "column_roles": column_roles, "warnings": warnings,
+    }
+
+# 🪶 產出報告前只保留要分析的欄位、類別欄位轉 category、數值欄位無損降位（同一組檔案只做一次）
+@st.cache_resource(max_entries=2, show_spinner="🪶 整理資料欄位中...")
+def prepare_dataset(data_key, code_key, _df, column_types):
+    return prepare_frame(_df, column_types)
+
+# 🧱 分塊模式只讀前幾列做預覽與欄位比對，完整資料在產出報告時逐塊讀取
+def read_uploaded_csv_preview(uploaded_file, nrows=5):
+    chunks = iter_csv_chunks(uploaded_file, chunksize=nrows)
+    try:
+        return next(chunks)
+    except Exception:
+        st.error("❌ 檔案無法讀取，請確認是否為有效的 CSV 並使用常見編碼（UTF-8、BIG5、CP950）")
+        return None
+    finally:
+        chunks.close()
+        uploaded_file.seek(0)
 tab1, tab2 = st.tabs(["📄 Codebook 產生器","📊 進階分析工具(尚在處理)", ])
 
 
@@ -80,17 +200,34 @@ with tab1:
 
     # 📁 第一步：上傳主資料
     st.header("📁 資料上傳")
-    data_file = st.file_uploader("請上傳主資料 CSV", type=["csv"], key="data")
+    data_file = st.file_uploader("請上傳主資料（CSV／Parquet／Feather／Arrow）", type=DATA_FILE_TYPES, key="data")
+    chunked_mode = st.checkbox(
+        "🧱 大型檔案分塊模式（不將整份資料載入記憶體）", key="chunked",
+        help="適用於數 GB 的 CSV：統計量以分塊累計，四分位數與直方圖為近似值，且不繪製 KDE。"
+    )
 
     df = None
     code_df = None
+    data_kind = input_kind(data_file.name) if data_file else "csv"
+    data_columns = None
 
     if data_file:
-        df = read_uploaded_csv(data_file)
+        if data_kind != "csv":
+            # 🧊 欄式檔案先只讀 schema 與前幾列，等 code.csv 上傳後再讀入用到的欄位
+            if chunked_mode:
+                st.info("🧊 Parquet／Feather／Arrow 檔案只會讀入 code.csv 用到的欄位，不需分塊模式。")
+                chunked_mode = False
+            df = read_uploaded_columnar(data_file, data_kind, nrows=5)
+            if df is not None:
+                data_columns = uploaded_columns(data_file, data_kind)
+        elif chunked_mode:
+            df = read_uploaded_csv_preview(data_file)
+        else:
+            df = read_uploaded_csv(data_file)
+            if df is not None:
+                df = clean_data(df)
         if df is not None:
-            df = df.dropna(how="all")
-            df.columns = df.columns.str.strip()
-            df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+            data_columns = data_columns or list(df.columns)
             st.success("✅ 主資料上傳成功！")
             st.dataframe(df.head())
 
@@ -104,79 +241,45 @@ with tab1:
     if code_file:
         code_df = read_uploaded_csv(code_file)
         if code_df is not None:
-            code_df = code_df.dropna(how="all")
-            # 去除 Variable 欄為空白或僅含空格的列
-            
-            code_df.columns = code_df.columns.str.strip().str.lower()
+            code_df = clean_code(code_df)
         if "target" not in code_df.columns:
             st.info("🔍 未偵測到 `Target` 欄位，預設所有變數皆為自變數（X）")
         
         if "variable" not in code_df.columns or "type" not in code_df.columns:
             st.error("❌ code.csv 檔案中需包含 'Variable' 與 'Type' 欄位")
         else:
-            # ➤ 抓取交集變數
-            code_vars = code_df["variable"].astype(str).str.strip().tolist()
-            df_vars = df.columns.tolist()
-            common_vars = list(set(code_vars) & set(df_vars))
+            # ➤ 抓取交集變數，code_df 只保留交集變數；類型與 X/Y 角色一併解析（依兩個檔案內容快取）
+            resolved = resolve_codebook(upload_key(data_file), upload_key(code_file), data_columns, code_df)
+            code_df = resolved["code_df"]
+            common_vars = resolved["common_vars"]
+            excluded_vars = resolved["excluded_vars"]
+            excluded_code_vars = resolved["excluded_code_vars"]
 
             # ➤ 顯示落選的變數（只在 code.csv 裡但主資料中找不到）
-            excluded_vars = sorted(set(code_vars) - set(df_vars))
             if excluded_vars:
                 st.warning(f"⚠️ 有 {len(excluded_vars)} 個變數未在主資料中找到，已被略過：")
                 st.code(", ".join(excluded_vars), language="text")
 
-            excluded_code_vars = sorted(set(df_vars) - set(code_vars))
             if excluded_code_vars:
                 st.warning(f"⚠️ 有 {len(excluded_code_vars)} 個變數未在 code 中找到，已被略過：")
                 st.code(", ".join(excluded_code_vars), language="text")
 
             st.info(f"✅ 同時存在於主資料與 Codebook 的變數數量：{len(common_vars)}")
 
-            # ➤ 過濾 code_df 只保留交集變數
-            code_df = code_df[code_df["variable"].astype(str).str.strip().isin(common_vars)].reset_index(drop=True)
-
             # 🧩 處理變數屬性
-            column_types = {}
-            variable_names = {}
-            column_roles = {}
-            x_counter = y_counter = 1
-
-            for _, row in code_df.iterrows():
-                col = str(row["variable"]).strip()
-                t = str(row.get("type", "")).strip().lower()
-                target = str(row.get("target", "") if "target" in row else "").strip().lower()
-
-                if col not in df.columns:
-                    continue  # 雙保險防呆
-
-                if target in ["y", "yes", "target", "1"]:
-                    column_roles[col] = f"Y{y_counter}"
-                    variable_names[col] = f"Y{y_counter}"
-                    # 根據 type 欄位設定 column_types
-                    if t in ["2", "categorical", "類別"]:
-                        column_types[col] = 2
-                    else:
-                        column_types[col] = 1  # 預設為數值型
-                    
-                    y_counter += 1
-                    continue
-                    
-                if t in ["", "0", "none"]:
-                    continue  # 自動略過
-
-                if t in ["1", "numerical","連續"]:
-                    column_roles[col] = f"X{x_counter}"
-                    column_types[col] = 1
-                    x_counter += 1
-                elif t in ["2", "categorical","類別"]:
-                    column_roles[col] = f"X{x_counter}"
-                    column_types[col] = 2
-                    x_counter += 1
-                else:
-                    st.warning(f"⚠️ Unknown Type '{t}' for column '{col}' — skipped.")
-                    continue
+            column_types = resolved["column_types"]
+            variable_names = resolved["variable_names"]
+            column_roles = resolved["column_roles"]
+            for message in resolved["warnings"]:
+                st.warning(message)
+
+            # 🧊 欄式檔案：只讀入實際要分析的欄位（其餘欄位不會載入記憶體）
+            if data_kind != "csv":
+                df = read_uploaded_columnar(data_file, data_kind, columns=tuple(column_types))
 
-                variable_names[col] = column_roles.get(col, col)
+            if df is not None and not chunked_mode:
+                df, memory = prepare_dataset(upload_key(data_file), upload_key(code_file), df, column_types)
+                st.caption(f"🪶 只保留 {df.shape[1]} 個分析欄位並縮小資料型別：{format_memory(memory)}")
 
             # 📊 顯示變數類型統計
             st.subheader("📊 變數類型統計")
@@ -191,44 +294,94 @@ with tab1:
             # 📤 產出報告按鈕
             st.markdown("---")
             st.subheader("📤 Codebook 報告產出")
+            with st.expander("📄 報告格式", expanded=False):
+                st.caption("HTML 與 Markdown 不經過 python-docx，產出較快，圖檔內嵌於單一檔案；分割輸出與更新模式只適用於 Word。")
+                report_format = st.selectbox(
+                    "輸出格式", list(OUTPUT_FORMATS),
+                    format_func={"docx": "Word (.docx)", "html": "HTML (.html)", "md": "Markdown (.md)"}.get
+                )
+            with st.expander("⚙️ 圖片設定", expanded=False):
+                image_dpi = st.select_slider("圖片解析度（DPI）", options=[72, 100, 150, 200], value=100)
+                image_format = st.selectbox(
+                    "圖片格式", ["png", "png8", "jpeg"],
+                    format_func={"png": "PNG", "png8": "PNG（256 色壓縮，檔案較小）", "jpeg": "JPEG"}.get
+                )
+                fast_kde = st.checkbox("快速版也加入 KDE 圖", value=False)
+            with st.expander("🔎 預覽模式（抽樣估計，適合大型資料反覆調整）", expanded=False):
+                st.caption("計數與缺失值仍為精確值；分位數、boxplot、histogram 與 KDE 由固定 seed 的分層抽樣估計，每個變數會註明誤差範圍。")
+                preview_mode = st.checkbox("以抽樣產出預覽版報告", value=False)
+                preview_rows = st.number_input("抽樣列數", min_value=1_000, max_value=5_000_000, value=100_000, step=10_000)
+            with st.expander("🧩 分割輸出（大型 codebook）", expanded=False):
+                st.caption("完整版報告依變數數量、X/Y 角色或類型分成多份 .docx，與索引文件（index.docx）一起打包成 zip 下載；分割輸出時不使用更新模式。")
+                shard_mode = st.checkbox("分割成多份文件", value=False)
+                shard_by = st.selectbox(
+                    "分割方式", SHARD_MODES,
+                    format_func={"count": "依變數數量", "role": "依 X／Y 角色", "type": "依變數類型"}.get
+                )
+                shard_size = st.number_input("每份最多變數數", min_value=10, max_value=5_000, value=DEFAULT_SHARD_SIZE, step=10)
+            with st.expander("🔁 更新模式（只重建有變動的變數）", expanded=False):
+                st.caption("上傳前一版報告與其指紋檔（codebook.fingerprint.json），資料與設定皆未變動的變數章節會直接沿用。")
+                previous_report = st.file_uploader("前一版 Codebook 報告（.docx）", type=["docx"], key="prev_report")
+                previous_fingerprint = st.file_uploader("前一版指紋檔（.json）", type=["json"], key="prev_fingerprint")
+            # ⏳ 報告在背景工作佇列產出（直接寫入記憶體緩衝區），頁面不會被卡住，可隨時取消
             if st.button("🚀 產出 Codebook 報告"):
-                with st.spinner("📄 報告產出中，請稍候..."):
-                    try:
-                        output_path = "codebook.docx"
-
-                        # 🧠 假設你已經有這個函數
-                        output_path = generate_codebook(
-                            df, column_types, variable_names, {},
-                            code_df=code_df, output_path=output_path
-                        )
-
-                        with open(output_path, "rb") as f:
-                            b64 = base64.b64encode(f.read()).decode()
-                            href = f'<a href="data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{b64}" download="{output_path}">📥 點我下載 Codebook 報告</a>'
-                            st.markdown(href, unsafe_allow_html=True)
-
-                        st.success("✅ 報告產出完成！")
-                    except Exception as e:
-                        st.error(f"❌ 報告產出失敗：{e}")
+                generators = load_generators()
+                docx_only = report_format == "docx"
+                use_previous = bool(previous_report and previous_fingerprint) and not shard_mode and docx_only
+                shard_options = {}
+                if shard_mode and docx_only:
+                    shard_options = dict(shard_by=shard_by, shard_size=int(shard_size), column_roles=column_roles)
+                report_name = "codebook.zip" if shard_options else "codebook" + OUTPUT_FORMATS[report_format]
+                if chunked_mode:
+                    # 唯讀 memoryview 直接讀上傳檔的緩衝區，不另外複製整份檔案
+                    job = get_job_manager().submit(
+                        generators["chunked"],
+                        data_file.getbuffer().toreadonly(), column_types, variable_names, {},
+                        code_df=code_df, dpi=image_dpi, image_format=image_format, **shard_options,
+                        output_format=report_format, label="", file_name=report_name, in_memory=True
+                    )
+                    st.session_state["codebook_fingerprint"] = None
+                else:
+                    fingerprint_buffer = io.BytesIO() if docx_only else None  # 更新模式只適用於 Word
+                    job = get_job_manager().submit(
+                        generators["full"],
+                        df, column_types, variable_names, {},
+                        code_df=code_df, dpi=image_dpi, image_format=image_format,
+                        preview_mode=preview_mode, sample_size=int(preview_rows),
+                        cache=get_report_cache(),
+                        previous_report=previous_report.getvalue() if use_previous else None,
+                        previous_fingerprint=io.BytesIO(previous_fingerprint.getvalue()) if use_previous else None,
+                        fingerprint_path=fingerprint_buffer, **shard_options, output_format=report_format,
+                        label="", file_name=report_name, in_memory=True
+                    )
+                    st.session_state["codebook_fingerprint"] = fingerprint_buffer
+                st.session_state["codebook_job"] = job.id
             elif st.button("🚀 快速產出 Codebook 報告 (Fast Mode)"):
-                with st.spinner("📄 快速報告產出中，請稍候..."):
-                    try:
-                        output_path = "codebook_fast.docx"
-
-                        # 使用快速版函數
-                        output_path = generate_codebook_fast(
-                            df, column_types, variable_names, {},
-                            code_df=code_df, output_path=output_path
-                        )
-
-                        with open(output_path, "rb") as f:
-                            b64 = base64.b64encode(f.read()).decode()
-                            href = f'<a href="data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{b64}" download="{output_path}">📥 點我下載快速版 Codebook 報告</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                generators = load_generators()
+                if chunked_mode:
+                    job = get_job_manager().submit(
+                        generators["chunked"],
+                        data_file.getbuffer().toreadonly(), column_types, variable_names, {},
+                        code_df=code_df, fast=True, image_format=image_format, renderer="raster",
+                        output_format=report_format, label="快速版",
+                        file_name="codebook_fast" + OUTPUT_FORMATS[report_format], in_memory=True
+                    )
+                else:
+                    job = get_job_manager().submit(
+                        generators["fast"],
+                        df, column_types, variable_names, {},
+                        code_df=code_df, image_format=image_format, cache=get_report_cache(),
+                        include_kde=fast_kde, renderer="raster", output_format=report_format, label="快速版",
+                        file_name="codebook_fast" + OUTPUT_FORMATS[report_format], in_memory=True
+                    )
+                st.session_state["codebook_job"] = job.id
+                st.session_state["codebook_fingerprint"] = None
 
-                        st.success("✅ 快速版報告產出完成！")
-                    except Exception as e:
-                        st.error(f"❌ 快速版報告產出失敗：{e}")
+            job = get_job_manager().get(st.session_state.get("codebook_job"))
+            if job is not None and job.active:
+                show_job_progress(job.id)
+            elif job is not None:
+                show_job_result(job)
 
 
 
@@ -245,7 +398,8 @@ with tab2:
     - 若為 `cut:[0,100,200,300]` → 依指定切點分箱。
     - 若為 `cut:3` → 依分位數切成 3 組。
     - 若為 `24,30` → 依數字切成 `<24`, `24–30`, `>30` 三組。
-    - 若為 `onehot` → 進行 one-hot 編碼。
+    - 若為 `onehot` → 進行 one-hot 編碼（類別很多時自動改用 sparse 欄位，不會占用大量記憶體）。
+    - 若為 `onehot:50` → 只保留最常見的 50 類，其餘歸入 `<變數>_other`。
 
     轉換後：
     - 原始欄位將被移除
@@ -254,135 +408,87 @@ with tab2:
     """)
 
     # === 檔案上傳 ===
-    uploaded_main = st.file_uploader("📂 請上傳主資料（CSV）", type=["csv"], key="main2")
+    uploaded_main = st.file_uploader("📂 請上傳主資料（CSV／Parquet／Feather／Arrow）", type=DATA_FILE_TYPES, key="main2")
     uploaded_code = st.file_uploader("📋 請上傳 code.csv（需包含 Variable、Transform 欄位）", type=["csv"], key="code2")
 
-    df2, code2 = None, None
-    if uploaded_main:
-        df2 = read_uploaded_csv(uploaded_main)
-    if uploaded_code:
+    uploaded_pipeline = st.file_uploader(
+        "🧩（選填）已存的轉換器 transform_pipeline.json：沿用相同的切點與 one-hot 類別逐塊轉換新資料，不需 code.csv",
+        type=["json"], key="pipeline2"
+    )
+
+    df2, code2, pipeline = None, None, None
+    if uploaded_pipeline:
+        try:
+            pipeline = TransformPipeline.load(uploaded_pipeline)
+        except (ValueError, KeyError) as e:
+            st.error(f"❌ 轉換器檔案無法讀取：{e}")
+    if uploaded_code and pipeline is None:
         code2 = read_uploaded_csv(uploaded_code)
+    if uploaded_main and pipeline is not None:
+        # 🧩 套用已存的轉換器：CSV 逐塊讀取、轉換後寫出，記憶體中一次只有一塊資料
+        main_kind = input_kind(uploaded_main.name)
+        output = io.BytesIO()
+        try:
+            if main_kind == "csv":
+                rows = pipeline.transform_csv(uploaded_main, output)
+            else:
+                transformed = pipeline.transform(read_columnar(uploaded_main, main_kind, columns=pipeline.inputs))
+                transformed.to_csv(output, index=False, encoding="utf-8-sig")
+                rows = len(transformed)
+        except ValueError as e:
+            st.error(f"❌ 轉換失敗：{e}")
+        else:
+            st.success(f"✅ 已以轉換器轉換 {rows:,} 筆資料")
+            st.subheader("🔍 預覽轉換後資料")
+            output.seek(0)
+            st.dataframe(pd.read_csv(output, nrows=5, encoding="utf-8-sig"))
+            st.download_button("📥 下載轉換後的資料 (CSV)", data=output.getvalue(), file_name="transformed_data.csv", mime="text/csv")
+            st.download_button(
+                "📥 下載轉換後的 code.csv",
+                data=pd.DataFrame(pipeline.code).to_csv(index=False).encode("utf-8-sig"),
+                file_name="code_transformed.csv", mime="text/csv"
+            )
+    elif uploaded_main:
+        main_kind = input_kind(uploaded_main.name)
+        if main_kind == "csv":
+            df2 = read_uploaded_csv(uploaded_main)
+        elif code2 is not None:
+            # 🧊 欄式檔案只讀入 code.csv 列出的變數
+            variables = code2.rename(columns=lambda c: str(c).strip().lower()).get("variable")
+            if variables is None:
+                st.error("❌ code.csv 缺少 Variable 欄位")
+            else:
+                df2 = read_uploaded_columnar(uploaded_main, main_kind, columns=tuple(variables.astype(str).str.strip()))
 
     if df2 is not None and code2 is not None:
         st.success(f"✅ 主資料與 code.csv 載入成功，共 {df2.shape[0]} 筆資料")
 
-        # 標準化欄位名稱
-        code2.columns = code2.columns.str.strip().str.lower()
-
-        variable_names = {}  # 映射新舊欄位名稱
-        transformed_vars = []  # 儲存轉換後的變數資訊
-        for _, row in code2.iterrows():
-            col = str(row.get("variable", "")).strip()
-            transform = str(row.get("transform", "")).strip()
-
-            if not col or col not in df2.columns:
-                continue
-
-            # === case 1: 無 Transform → 保留原始欄位 ===
-            if transform.lower() in ["", "nan", "none"]:
-                orig_type = str(row.get("type", "1")).strip().lower()
-
-                # 做 mapping，避免直接轉 int 出錯
-                type_map = {
-                    "1": 'Numerical', "numerical": 'Numerical', "連續": 1, "數值": 'Numerical',
-                    "2": 'Categorical', "categorical": 'Categorical', "類別": 'Categorical'
-                }
-
-                # 如果沒辦法辨識，就預設 1
-                t_val = type_map.get(orig_type, 1)
-
-                transformed_vars.append({"Variable": col, "Type": t_val, "Description": row.get("description"), "Transform": ""})
-
-                continue
-
-
-            # === case 2: cut:[…] → 手動分箱 ===
-            if transform.lower().startswith("cut:["):
-                try:
-                    bins = eval(transform[4:])
-                    new_col = col + "_binned"
-                    df2[new_col] = pd.cut(df2[col], bins=bins, include_lowest=True, labels=False)
-                    variable_names[new_col] = col
-                    df2.drop(columns=[col], inplace=True)
-
-                    # ⬅️ 把轉換後的新欄位記錄下來
-                    transformed_vars.append({"Variable": new_col, "Type": "Categorical", "Description": row.get("description"), "Transform": transform})
-
-
-                except Exception as e:
-                    st.warning(f"🔸 {col} 分箱失敗：{e}")
-                continue
-
-            # === case 3: cut:k → 分位數切分 ===
-            if transform.lower().startswith("cut:"):
-                try:
-                    k = int(transform.split(":")[1])
-                    new_col = col + "_binned"
-                    df2[new_col] = pd.qcut(df2[col], q=k, labels=False, duplicates="drop")
-                    variable_names[new_col] = col
-                    df2.drop(columns=[col], inplace=True)
-                    transformed_vars.append({"Variable": new_col, "Type": "Categorical", "Description": row.get("description"), "Transform": transform})
-
-                except Exception as e:
-                    st.warning(f"🔸 {col} 分位數切分失敗：{e}")
-                continue
-
-            # === case 4: 逗號分隔數字 → 自訂切分點 ===
-            if "," in transform:
-                try:
-                    cuts = [float(x.strip()) for x in transform.split(",") if x.strip()]
-                    bins = [-float("inf")] + cuts + [float("inf")]
-                    new_col = col + "_binned"
-                    df2[new_col] = pd.cut(df2[col], bins=bins, labels=False)
-                    variable_names[new_col] = col
-                    df2.drop(columns=[col], inplace=True)
-                    transformed_vars.append({"Variable": new_col, "Type": "Categorical", "Description": row.get("description"), "Transform": transform})
-
-                except Exception as e:
-                    st.warning(f"🔸 {col} 自訂切分失敗：{e}")
-                continue
-
-            # === case 5: onehot ===
-            if transform.lower() == "onehot" or df2[col].dtype == "object":
-                try:
-                    onehot = pd.get_dummies(df2[col], prefix=col, dtype=int)
-                    for new_col in onehot.columns:
-                        variable_names[new_col] = col
-                    df2 = pd.concat([df2.drop(columns=[col]), onehot], axis=1)
-                    for new_col in onehot.columns:
-                        transformed_vars.append({"Variable": new_col, "Type": "Categorical", "Description": row.get("description"), "Transform": "onehot"})
-
-                except Exception as e:
-                    st.warning(f"🔸 {col} one-hot 編碼失敗：{e}")
-                continue
-            # === case: 單一數字 → 切兩類 (<cut_point → 0, >=cut_point → 1) ===
-            if transform.replace(".", "", 1).isdigit():  # 判斷是不是數字 (含小數)
-                try:
-                    cut_point = float(transform)
-                    new_col = col + "_binned"
-
-                    # 分箱：左閉右開，確保 <cut_point = 0, >=cut_point = 1
-                    df2[new_col] = (df2[col] >= cut_point).astype(int)
-
-                    variable_names[new_col] = col
-                    df2.drop(columns=[col], inplace=True)
-                    transformed_vars.append({"Variable": new_col, "Type": "Categorical", "Description": row.get("description"), "Transform": transform})
-
-                except Exception as e:
-                    st.warning(f"🔸 {col} 單一數字分界失敗：{e}")
-                continue
-
-            # === case 6: 未知指令 ===
-            st.warning(f"🔸 未知 Transform 指令：{transform}（欄位 {col}）")
+        # 標準化欄位名稱（rename 產生新的表，不改動快取中的 code.csv）
+        code2 = code2.rename(columns=lambda c: str(c).strip().lower())
+
+        # 🔧 Transform 欄位先編譯成轉換計畫，所有新欄位算完後只組裝一次輸出表格
+        result = apply_plan(df2, compile_plan(code2))
+        df2 = result["df"]
+        transformed_vars = result["code"]  # 儲存轉換後的變數資訊
+        for message in result["warnings"]:
+            st.warning(message)
+
+        # 🧩 學到的分位數切點與 one-hot 類別存成轉換器，之後的新資料可套用相同的轉換
+        st.download_button(
+            "📥 下載轉換器（transform_pipeline.json）",
+            data=result["pipeline"].to_json().encode("utf-8"),
+            file_name="transform_pipeline.json", mime="application/json"
+        )
 
         # === 預覽結果 ===
         st.markdown("---")
         st.subheader("🔍 預覽轉換後資料")
-        st.dataframe(df2.head())
+        st.dataframe(to_dense(df2.head()))
 
-        # === 提供下載轉換後 CSV ===
-        csv = df2.to_csv(index=False).encode('utf-8-sig')
-        st.download_button("📥 下載轉換後的資料 (CSV)", data=csv, file_name="transformed_data.csv", mime="text/csv")
+        # === 提供下載轉換後 CSV（分段匯出，sparse one-hot 欄位不會一次展開）===
+        csv = io.BytesIO()
+        export_csv(df2, csv)
+        st.download_button("📥 下載轉換後的資料 (CSV)", data=csv.getvalue(), file_name="transformed_data.csv", mime="text/csv")
         #transformed_vars = []
 
         # 轉成 DataFrame
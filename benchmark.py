@@ -0,0 +1,118 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# ⏱️ 效能量測：python benchmark.py render --rows 100000 --repeat 20
+#             python benchmark.py imports --budget 1.5
+IMPORT_BUDGET_SECONDS = 1.5  # 冷啟動時 App.py 第一次執行（上傳頁面出現前）的時間上限
+# 這些套件應在第一次產出報告時才載入，不應出現在上傳頁面的匯入鏈中
+LAZY_MODULES = ["matplotlib", "seaborn", "docx", "test", "fast", "raster"]
+
+
+def _timeit(func, repeat):
+    func()  # 暖身（字型載入、matplotlib 初始化）
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_render(rows, repeat):
+    import matplotlib
+    matplotlib.use("Agg")
+    from fast import _numeric_figures, _categorical_figures, _raster_numeric_figures, _raster_categorical_figures
+    from stats import compute_column_stats
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "continuous": rng.lognormal(10, 1, rows),
+        "integer": rng.integers(0, 40, rows).astype(float),
+        "category": rng.choice(list("ABCDEFGH"), rows),
+    })
+    stats = compute_column_stats(df, {"continuous": 1, "integer": 1, "category": 2}, kde=True)
+    value_counts = stats["category"]["value_counts"]
+
+    cases = [
+        ("numeric (boxplot + hist + KDE)", 3,
+         lambda: _numeric_figures("continuous", stats["continuous"]),
+         lambda: _raster_numeric_figures("continuous", stats["continuous"])),
+        ("integer (boxplot + hist + KDE)", 3,
+         lambda: _numeric_figures("integer", stats["integer"]),
+         lambda: _raster_numeric_figures("integer", stats["integer"])),
+        ("categorical (bar count plot)", 1,
+         lambda: _categorical_figures("category", value_counts),
+         lambda: _raster_categorical_figures("category", value_counts)),
+    ]
+    print(f"rows={rows:,} repeat={repeat}")
+    print(f"{'case':32s} {'matplotlib ms/chart':>20s} {'raster ms/chart':>16s} {'speedup':>8s}")
+    for name, charts, mpl_func, raster_func in cases:
+        mpl_ms = _timeit(mpl_func, repeat) / charts
+        raster_ms = _timeit(raster_func, repeat) / charts
+        print(f"{name:32s} {mpl_ms:20.2f} {raster_ms:16.2f} {mpl_ms / raster_ms:7.1f}x")
+
+
+def bench_imports(budget, repeat):
+    # 在全新的直譯器中執行 App.py（Streamlit bare mode），以 -X importtime 量測匯入時間
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = (
+        "import sys, time; start = time.perf_counter(); import App; "
+        "print('WALL', time.perf_counter() - start); "
+        f"print('LOADED', ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    walls, modules, loaded = [], {}, ""
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=here,
+                              capture_output=True, text=True, check=True)
+        for line in proc.stdout.splitlines():
+            if line.startswith("WALL"):
+                walls.append(float(line.split()[1]))
+            elif line.startswith("LOADED"):
+                loaded = line[len("LOADED "):].strip()
+        children = []  # importtime 先列子模組再列父模組；只統計 App 直接匯入的模組
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            if depth == 1:
+                children.append((name.strip(), int(cumulative) / 1e6))
+            elif depth == 0:
+                if name.strip() == "App":
+                    for child, seconds in children:
+                        modules[child] = min(modules.get(child, float("inf")), seconds)
+                children = []
+
+    wall = min(walls)
+    print(f"App.py cold start: {wall:.3f} s (best of {repeat}, budget {budget:.2f} s)")
+    print(f"{'imported by App.py':32s} {'cumulative s':>12s}")
+    for name, seconds in sorted(modules.items(), key=lambda item: -item[1])[:12]:
+        print(f"{name:32s} {seconds:12.3f}")
+    ok = wall <= budget and not loaded
+    if loaded:
+        print(f"❌ 上傳頁面不應載入：{loaded}")
+    print("✅ within budget" if ok else "❌ over budget")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Codebook 產生器效能量測")
+    sub = parser.add_subparsers(dest="command", required=True)
+    render = sub.add_parser("render", help="比較 matplotlib 與輕量點陣繪圖的單張圖成本")
+    render.add_argument("--rows", type=int, default=100_000)
+    render.add_argument("--repeat", type=int, default=20)
+    imports = sub.add_parser("imports", help="量測 App.py 冷啟動匯入時間並檢查是否超出預算")
+    imports.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS)
+    imports.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.command == "render":
+        bench_render(args.rows, args.repeat)
+    elif args.command == "imports":
+        sys.exit(bench_imports(args.budget, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# 🗃️ 跨次產出報告的統計量與圖檔快取
+#    key = 欄位資料內容雜湊 + 欄名 + 變數類型 + 繪圖選項；只改 Description 等 metadata 時全部命中
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 磁碟快取超過上限時淘汰到上限的 90%，之後的寫入不會每次都再掃描目錄
+DISK_EVICT_RATIO = 0.9
+
+
+class ReportCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else max_bytes * 4
+        self._items = OrderedDict()  # key → pickled bytes，依最近使用排序（LRU）
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_size = 0  # 磁碟快取總大小：啟動時掃描一次，之後寫入與刪除時更新，超過上限才重新掃描
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_size = sum(size for _, size, _ in self._disk_entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            blob = self._items.get(key)
+            if blob is not None:
+                self._items.move_to_end(key)
+        if blob is None and self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    blob = f.read()
+                os.utime(self._path(key))  # 更新存取時間，磁碟也依 LRU 淘汰
+            except OSError:
+                return None
+            self._remember(key, blob)
+        return pickle.loads(blob) if blob is not None else None
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.directory:
+            tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            try:
+                replaced = os.stat(self._path(key)).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, self._path(key))
+            with self._lock:
+                self._disk_size += len(blob) - replaced
+                over = self._disk_size > self.max_disk_bytes
+            if over:
+                self._evict_disk()
+
+    def _remember(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = blob
+            self._size += len(blob)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict_disk(self):
+        # 只在記錄的總大小超過上限時才掃描目錄；其他程序也可能寫入同一目錄，以掃描結果校正記錄
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * DISK_EVICT_RATIO if total > self.max_disk_bytes else total
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_size = total
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+def column_fingerprint(series):
+    # 內容雜湊含索引（報告會列出缺失值的索引）與 dtype
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(series.dtype).encode())
+    h.update(pd.util.hash_pandas_object(series, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def column_key(series, col, type_code, *options):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((str(col), type_code, options)).encode())
+    h.update(column_fingerprint(series).encode())
+    return h.hexdigest()
+
+
+def strip_values(entry):
+    # 快取只存統計量，不存原始資料
+    return {k: v for k, v in entry.items() if k != "values"}
+
+
+def lookup_columns(cache, df, column_types, *options):
+    # 回傳 (每欄 cache key, 命中的欄位 → {"stats": ..., "images": [...]})
+    keys, hits = {}, {}
+    for col, type_code in column_types.items():
+        if col not in df.columns:
+            continue
+        keys[col] = column_key(df[col], col, type_code, *options)
+        record = cache.get(keys[col])
+        if record is not None:
+            hits[col] = record
+    return keys, hits
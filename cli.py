@@ -0,0 +1,183 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from loaders import DATA_FILE_TYPES
+from shards import SHARD_MODES, DEFAULT_SHARD_SIZE
+from renderers import OUTPUT_FORMATS
+
+# 🖥️ 命令列批次模式：一次產出多份 codebook，不必經過 Streamlit 上傳流程
+#    python cli.py datasets/ --out reports/ --workers 4
+#    python cli.py manifest.csv --mode fast
+#    每個 worker 行程只載入一次 pandas／matplotlib／字型，之後連續處理多份資料
+CODE_SUFFIXES = ["_code.csv", ".code.csv"]
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    import test  # noqa: F401  預先載入產生器與中文字型
+    import fast  # noqa: F401
+
+
+def discover_pairs(directory):
+    # 目錄中的 <name>.csv（或 .parquet／.feather／.arrow）搭配 <name>_code.csv（或 <name>.code.csv）；
+    # 子目錄中若有 code.csv，與同目錄唯一的其他資料檔配成一組，名稱取子目錄名
+    pairs = []
+    for code_path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        for suffix in CODE_SUFFIXES:
+            if not code_path.endswith(suffix):
+                continue
+            stem = code_path[:-len(suffix)]
+            for ext in DATA_FILE_TYPES:
+                if os.path.exists(f"{stem}.{ext}"):
+                    pairs.append({"name": os.path.basename(stem), "data": f"{stem}.{ext}", "code": code_path})
+                    break
+    for code_path in sorted(glob.glob(os.path.join(directory, "*", "code.csv"))):
+        folder = os.path.dirname(code_path)
+        data_paths = [p for ext in DATA_FILE_TYPES for p in glob.glob(os.path.join(folder, f"*.{ext}"))
+                      if os.path.basename(p) != "code.csv" and not p.endswith(tuple(CODE_SUFFIXES))]
+        if len(data_paths) == 1:
+            pairs.append({"name": os.path.basename(folder), "data": data_paths[0], "code": code_path})
+    return pairs
+
+
+def read_manifest(path):
+    # manifest：CSV（欄位 data, code，選填 name, output）或 JSON 陣列 [{"data": ..., "code": ...}, ...]；
+    # 相對路徑以 manifest 所在目錄為準
+    base = os.path.dirname(os.path.abspath(path))
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    pairs = []
+    for row in rows:
+        row = {str(k).strip().lower(): str(v).strip() for k, v in row.items() if v}
+        pair = {
+            "name": row.get("name") or os.path.splitext(os.path.basename(row["data"]))[0],
+            "data": os.path.join(base, row["data"]),
+            "code": os.path.join(base, row["code"]),
+        }
+        if row.get("output"):
+            pair["output"] = os.path.join(base, row["output"])
+        pairs.append(pair)
+    return pairs
+
+
+def run_pair(pair, out_dir, mode, options):
+    from loaders import load_dataset
+    timings = {"name": pair["name"], "status": "ok", "error": None}
+    start = time.perf_counter()
+    try:
+        dataset = load_dataset(pair["data"], pair["code"])
+        timings["load"] = time.perf_counter() - start
+        timings["rows"] = len(dataset["df"])
+        timings["variables"] = len(dataset["column_types"])
+        timings["warnings"] = dataset["warnings"]
+        timings["memory"] = dataset["memory"]
+
+        # 副檔名依第一個輸出格式；多種格式時各格式換成自己的副檔名，分割輸出時改為 .zip
+        suffix = ("_fast" if mode == "fast" else "") + OUTPUT_FORMATS[options["formats"][0]]
+        output_path = pair.get("output") or os.path.join(out_dir, pair["name"] + suffix)
+        args = (dataset["df"], dataset["column_types"], dataset["variable_names"], {})
+        generate_start = time.perf_counter()
+        if mode == "fast":
+            from fast import generate_codebook_fast
+            output_path = generate_codebook_fast(*args, code_df=dataset["code_df"], output_path=output_path,
+                                                 image_format=options["image_format"], renderer=options["renderer"],
+                                                 include_kde=options["kde"], output_format=options["formats"])
+        else:
+            from test import generate_codebook
+            shard_options = {}
+            if options["shard_by"]:
+                shard_options = dict(shard_by=options["shard_by"], shard_size=options["shard_size"],
+                                     column_roles=dataset["column_roles"], workers=options["shard_workers"])
+            output_path = generate_codebook(*args, code_df=dataset["code_df"], output_path=output_path,
+                                            dpi=options["dpi"], image_format=options["image_format"],
+                                            preview_mode=bool(options["preview"]), sample_size=options["preview"],
+                                            output_format=options["formats"], **shard_options)
+        timings["generate"] = time.perf_counter() - generate_start
+        timings["output"] = output_path
+    except Exception as e:
+        timings["status"] = "failed"
+        timings["error"] = f"{type(e).__name__}: {e}"
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def print_summary(results, wall):
+    print(f"{'dataset':24s} {'rows':>9s} {'vars':>5s} {'load s':>8s} {'render s':>9s} {'total s':>8s}  status")
+    for r in results:
+        print(f"{r['name'][:24]:24s} {r.get('rows', 0):9,d} {r.get('variables', 0):5d} "
+              f"{r.get('load', 0):8.2f} {r.get('generate', 0):9.2f} {r['total']:8.2f}  "
+              f"{r['status'] if r['status'] == 'ok' else r['error']}")
+    ok = sum(r["status"] == "ok" for r in results)
+    busy = sum(r["total"] for r in results)
+    print(f"\n{ok}/{len(results)} codebooks in {wall:.2f} s wall clock ({busy:.2f} s of work)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批次產出 Codebook 報告")
+    parser.add_argument("source", help="含 <name>.csv（或 .parquet／.feather）+ <name>_code.csv 的目錄，或 manifest（.csv / .json）")
+    parser.add_argument("--out", default="codebooks", help="輸出目錄（manifest 可逐筆指定 output）")
+    parser.add_argument("--mode", choices=["full", "fast"], default="full")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="同時處理幾份資料")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--image-format", choices=["png", "png8", "jpeg"], default="png")
+    parser.add_argument("--renderer", choices=["matplotlib", "raster"], default="raster", help="Fast Mode 的繪圖方式")
+    parser.add_argument("--preview", type=int, default=0, metavar="ROWS",
+                        help="完整版改為預覽模式：分位數與圖由 ROWS 列的分層抽樣估計（0 為關閉）")
+    parser.add_argument("--format", nargs="+", choices=list(OUTPUT_FORMATS), default=["docx"], dest="formats",
+                        help="輸出格式，可同時指定多種（統計與繪圖只做一次），例如 --format docx html md")
+    parser.add_argument("--shard-by", choices=SHARD_MODES,
+                        help="完整版分割成多份文件（依變數數量／X、Y 角色／類型），與 index.docx 打包成 zip")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="分割輸出時每份最多幾個變數")
+    parser.add_argument("--kde", action="store_true", help="Fast Mode 也加入 KDE 圖（完整版一律包含）")
+    parser.add_argument("--verbose", action="store_true", help="列出每份資料的變數比對提示")
+    args = parser.parse_args(argv)
+
+    pairs = discover_pairs(args.source) if os.path.isdir(args.source) else read_manifest(args.source)
+    if not pairs:
+        print(f"No (data, code.csv) pairs found in {args.source}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    options = {"dpi": args.dpi, "image_format": args.image_format, "renderer": args.renderer, "kde": args.kde,
+               "preview": args.preview, "formats": args.formats, "shard_by": args.shard_by, "shard_size": args.shard_size,
+               # 只有一份資料時，各份分割文件改由 --workers 個行程平行產出
+               "shard_workers": args.workers if len(pairs) == 1 else None}
+
+    start = time.perf_counter()
+    results = []
+    workers = max(1, min(args.workers, len(pairs)))
+    if workers == 1:
+        _init_worker()
+        results = [run_pair(pair, args.out, args.mode, options) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(run_pair, pair, args.out, args.mode, options) for pair in pairs]
+            for future in as_completed(futures):
+                result = future.result()
+                print(f"[{len(results) + 1}/{len(pairs)}] {result['name']}: {result['status']}", file=sys.stderr)
+                results.append(result)
+        order = {pair["name"]: i for i, pair in enumerate(pairs)}
+        results.sort(key=lambda r: order[r["name"]])
+
+    if args.verbose:
+        from loaders import format_memory
+        for r in results:
+            for message in r.get("warnings", []):
+                print(f"{r['name']}: {message}")
+            if r.get("memory"):
+                print(f"{r['name']}: 🪶 {format_memory(r['memory'])}")
+    print_summary(results, time.perf_counter() - start)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
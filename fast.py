@@ -1,122 +1,176 @@
-from io import BytesIO
-from docx import Document
-from docx.shared import Inches
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import seaborn as sns
+from stats import compute_column_stats, missing_summary
+from imaging import save_figure, draw_histogram, draw_kde
+from cache import lookup_columns, strip_values
+from renderers import RendererGroup
+import raster
+
+
+def _numeric_figures(col, entry, dpi=72, image_format="png"):
+    # 由 stats 預先算好的 boxplot 摘要與分箱計數繪圖，不再傳入整欄原始資料
+    import matplotlib.pyplot as plt  # 只有 renderer="matplotlib" 才需要，raster 模式不載入 pyplot
+    images = []
+
+    # Boxplot
+    fig, ax = plt.subplots()
+    ax.bxp([entry["box"]], vert=True, patch_artist=True,
+           boxprops=dict(facecolor='lightblue', edgecolor='black'),
+           medianprops=dict(color='red'))
+    ax.set_title(f"Boxplot of {col}")
+    ax.set_xticks([1]); ax.set_xticklabels([col])
+    plt.tight_layout(); images.append(save_figure(fig, dpi=dpi, image_format=image_format)); plt.close(fig)
+
+    # Histogram（整數型每個整數一格，否則 'auto'）
+    fig, ax = plt.subplots()
+    counts, edges = entry["hist"]
+    draw_histogram(ax, counts, edges)
+    ax.set_title(f"Histogram of {col}")
+    ax.set_xlabel(col); ax.set_ylabel("Frequency")
+    plt.tight_layout(); images.append(save_figure(fig, dpi=dpi, image_format=image_format)); plt.close(fig)
+
+    # KDE（include_kde=True 時 stats 才會算曲線；變異數為 0 時不畫）
+    if entry.get("kde") is not None:
+        fig, ax = plt.subplots()
+        draw_kde(ax, *entry["kde"])
+        ax.set_title(f"KDE Plot of {col}")
+        ax.set_xlabel(col); ax.set_ylabel("Density")
+        plt.tight_layout(); images.append(save_figure(fig, dpi=dpi, image_format=image_format)); plt.close(fig)
+    return images
+
+
+def _categorical_figures(col, value_counts, dpi=72, image_format="png"):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    value_counts.plot(kind="bar", color="cornflowerblue", ax=ax)
+    ax.set_title(f"Count Plot of {col}")
+    ax.set_xlabel(col); ax.set_ylabel("Frequency")
+    plt.tight_layout(); image = save_figure(fig, dpi=dpi, image_format=image_format); plt.close(fig)
+    return [image]
+
+
+def _raster_numeric_figures(col, entry, image_format="png"):
+    # ⚡ renderer="raster"：由分箱計數與四分位數直接畫成點陣圖，不經過 matplotlib
+    counts, edges = entry["hist"]
+    images = [raster.render_boxplot(col, entry["box"], image_format=image_format),
+              raster.render_histogram(col, counts, edges, image_format=image_format)]
+    if entry.get("kde") is not None:
+        images.append(raster.render_kde(col, *entry["kde"], image_format=image_format))
+    return images
+
+
+def _raster_categorical_figures(col, value_counts, image_format="png"):
+    labels = [
+        str(int(cat)) if isinstance(cat, float) and cat.is_integer() else str(cat)
+        for cat in value_counts.index
+    ]
+    return [raster.render_bar(col, labels, value_counts.to_numpy(), image_format=image_format)]
+
 
 def generate_codebook_fast(
     df, column_types, variable_names, category_definitions, 
     code_df=None, output_path="codebook_fast.docx", 
-    include_figures=True, include_kde=False  # ← 新增 KDE 選配
+    include_figures=True, include_kde=False,  # ← KDE 選配：分箱 FFT 計算，成本與資料列數幾乎無關
+    stats=None, dpi=72, image_format="png", cache=None,
+    renderer="matplotlib",  # "raster"：輕量繪圖，單張圖成本約為 matplotlib 的十分之一
+    progress=None,  # progress(done, total, 變數名稱)：每處理一個變數回報一次
+    output_format="docx"  # "docx"／"html"／"md" 或其清單：一次統計與繪圖同時寫出多種格式
 ):
     if output_path is None:
         output_path = "codebook_fast.docx"
-
-    doc = Document()
-    doc.add_heading("Codebook Summary Report (Fast Mode)", level=1)
-
-    # ✅ 缺失值統計
-    valid_cols = [col for col in column_types.keys() if col in df.columns]
-    na_counts = df[valid_cols].isnull().sum()
-    na_percent = df[valid_cols].isnull().mean() * 100
-    na_df = pd.DataFrame({
-        "column": na_counts.index,
-        "missing_count": na_counts.values,
-        "missing_rate (%)": na_percent.round(2).values
-    }).query("`missing_count` > 0").reset_index(drop=True)
-
-    doc.add_heading("Missing Value Summary", level=2)
-    if not na_df.empty:
-        table = doc.add_table(rows=1 + len(na_df), cols=3)
-        table.style = "Table Grid"
-        table.cell(0, 0).text = "Variable"
-        table.cell(0, 1).text = "Missing Count"
-        table.cell(0, 2).text = "Missing Rate (%)"
-        for i, row in na_df.iterrows():
-            table.cell(i+1, 0).text = str(row["column"])
-            table.cell(i+1, 1).text = str(row["missing_count"])
-            table.cell(i+1, 2).text = str(row["missing_rate (%)"])
+    if renderer == "raster":
+        # raster 圖的像素大小固定（raster.DPI），其他解析度改用 matplotlib；快取 key 也以實際解析度為準
+        if dpi not in (None, raster.DPI):
+            raise ValueError(f"renderer=\"raster\" 只支援 {raster.DPI} dpi，請改用 renderer=\"matplotlib\"")
+        dpi = raster.DPI
+
+    doc = RendererGroup(output_format)
+    doc.heading("Codebook Summary Report (Fast Mode)", 1)
+
+    # ✅ 缺失值統計（與完整版共用 stats 的單次掃描結果；快取命中的欄位不重算）
+    cache_keys, cached = {}, {}
+    if stats is None:
+        if cache is not None:
+            cache_keys, cached = lookup_columns(cache, df, column_types, "fast", include_figures, include_kde,
+                                                dpi, image_format, renderer)
+        pending = {col: t for col, t in column_types.items() if col not in cached}
+        stats = compute_column_stats(df, pending, kde=include_figures and include_kde)
+        stats.update({col: record["stats"] for col, record in cached.items()})
+        stats = {col: stats[col] for col in column_types if col in stats}
+    na_rows = missing_summary(stats)
+
+    doc.heading("Missing Value Summary", 2)
+    if na_rows:
+        doc.table([["Variable", "Missing Count", "Missing Rate (%)"]] + [list(row) for row in na_rows])
     else:
-        doc.add_paragraph("No missing values in any columns.")
+        doc.paragraph("No missing values in any columns.")
 
     # 🔹 變數細節
-    columns = code_df["variable"] if code_df is not None and "variable" in code_df.columns else df.columns
-    for col in columns:
+    columns = code_df["variable"] if code_df is not None and "variable" in code_df.columns else list(stats)
+    for i, col in enumerate(columns):
         col = str(col).strip()
-        if col not in column_types or col not in df.columns:
+        if progress is not None:
+            progress(i, len(columns), col)
+        if col not in stats:
             continue
 
         var_name = variable_names.get(col, col)
-        doc.add_heading(f"Variable: {col} ({var_name})", level=2)
+        doc.heading(f"Variable: {col} ({var_name})", 2)
+
+        entry = stats[col]
+        images = []
 
         # 數值型
         if column_types[col] == 1:
-            data = pd.to_numeric(df[col], errors="coerce").dropna()
-            if data.empty:
+            if entry["count"] == 0:
                 continue
-            desc = data.describe()
-
-            table = doc.add_table(rows=5, cols=2)
-            table.style = "Table Grid"
-            table.cell(0, 0).text = "Mean";      table.cell(0, 1).text = f"{desc['mean']:.3f}"
-            table.cell(1, 0).text = "Std Dev";   table.cell(1, 1).text = f"{desc['std']:.3f}"
-            table.cell(2, 0).text = "Min";       table.cell(2, 1).text = f"{desc['min']:.3f}"
-            table.cell(3, 0).text = "Max";       table.cell(3, 1).text = f"{desc['max']:.3f}"
-            table.cell(4, 0).text = "Count";     table.cell(4, 1).text = str(len(data))
-
-            if include_figures:
-                # Boxplot
-                buf = BytesIO()
-                fig, ax = plt.subplots()
-                ax.boxplot([data], vert=True, patch_artist=True,
-                           boxprops=dict(facecolor='lightblue', color='black'),
-                           medianprops=dict(color='red'))
-                ax.set_title(f"Boxplot of {col}")
-                ax.set_xticks([1]); ax.set_xticklabels([col])
-                plt.tight_layout(); plt.savefig(buf, format="png", dpi=72); plt.close(fig)
-                buf.seek(0); doc.add_picture(buf, width=Inches(4.0)); buf.close()
-
-                # Histogram
-                buf = BytesIO()
-                fig, ax = plt.subplots()
-                if np.allclose(data, data.astype(int)):  # 整數型 → 每個整數一格
-                    bins = np.arange(data.min(), data.max() + 2) - 0.5
-                else:
-                    bins = "auto"
-                ax.hist(data, bins=bins, color='lightblue', edgecolor='black')
-                ax.set_title(f"Histogram of {col}")
-                ax.set_xlabel(col); ax.set_ylabel("Frequency")
-                plt.tight_layout(); plt.savefig(buf, format="png", dpi=72); plt.close(fig)
-                buf.seek(0); doc.add_picture(buf, width=Inches(4.0)); buf.close()
+            desc = entry
+
+            doc.table([
+                ["Mean", f"{desc['mean']:.3f}"],
+                ["Std Dev", f"{desc['std']:.3f}"],
+                ["Min", f"{desc['min']:.3f}"],
+                ["Max", f"{desc['max']:.3f}"],
+                ["Count", entry["count"]],
+            ])
+
+            if col in cached:
+                images = cached[col]["images"]
+            elif not include_figures:
+                images = []
+            elif renderer == "raster":
+                images = _raster_numeric_figures(col, entry, image_format)
+            else:
+                images = _numeric_figures(col, entry, dpi, image_format)
+            for image in images:
+                doc.image(image, 4.0)
 
 
         # 類別型
         elif column_types[col] == 2:
-            value_counts = df[col].value_counts(dropna=False)
-            total = len(df)
+            value_counts = entry["value_counts"]
+            total = entry["total"]
 
             summary_text = "\n".join([
                 f"{k}: {v} ({v/total:.1%})"
                 for k, v in value_counts.items()
             ])
 
-            table = doc.add_table(rows=2, cols=2)
-            table.style = "Table Grid"
-            table.cell(0, 0).text = "Summary"
-            table.cell(0, 1).text = summary_text
-            table.cell(1, 0).text = "Count"
-            table.cell(1, 1).text = str(total)
-
-            if include_figures:
-                buf = BytesIO()
-                fig, ax = plt.subplots()
-                value_counts.plot(kind="bar", color="cornflowerblue", ax=ax)
-                ax.set_title(f"Count Plot of {col}")
-                ax.set_xlabel(col); ax.set_ylabel("Frequency")
-                plt.tight_layout(); plt.savefig(buf, format="png", dpi=72); plt.close(fig)
-                buf.seek(0); doc.add_picture(buf, width=Inches(4.0)); buf.close()
-
-    doc.save(output_path)
+            doc.table([["Summary", summary_text], ["Count", total]])
+
+            if col in cached:
+                images = cached[col]["images"]
+            elif not include_figures:
+                images = []
+            elif renderer == "raster":
+                images = _raster_categorical_figures(col, value_counts, image_format)
+            else:
+                images = _categorical_figures(col, value_counts, dpi, image_format)
+            for image in images:
+                doc.image(image, 4.0)
+
+        if col in cache_keys and col not in cached:
+            cache.put(cache_keys[col], {"stats": strip_values(entry), "images": images})
+
+    output_path = doc.save(output_path)
+    if progress is not None:
+        progress(len(columns), len(columns), "")
     return output_path
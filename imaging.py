@@ -0,0 +1,75 @@
+import threading
+from io import BytesIO
+import numpy as np
+
+# 🖼️ 圖片輸出格式（python-docx 只接受點陣圖，向量格式無法嵌入 Word）
+#   png  ：matplotlib 預設 PNG
+#   png8 ：量化成 256 色調色盤並以 optimize 壓縮，圖表檔案約小一半
+#   jpeg ：有損壓縮，適合顏色漸層多的圖
+IMAGE_FORMATS = ("png", "png8", "jpeg")
+
+# 每個執行緒共用一個緩衝區，避免每張圖都重新配置記憶體
+_local = threading.local()
+
+
+def _buffer():
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = _local.buffer = BytesIO()
+    buf.seek(0)
+    buf.truncate()
+    return buf
+
+
+def save_figure(fig, dpi=None, image_format="png"):
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    buf = _buffer()
+    dpi = dpi or "figure"
+    if image_format == "jpeg":
+        fig.savefig(buf, format="jpeg", dpi=dpi, pil_kwargs={"quality": 85, "optimize": True})
+        return buf.getvalue()
+    fig.savefig(buf, format="png", dpi=dpi)
+    if image_format == "png":
+        return buf.getvalue()
+
+    from PIL import Image
+    buf.seek(0)
+    image = Image.open(buf).convert("RGB").quantize(256)
+    out = _buffer()
+    image.save(out, format="png", optimize=True)
+    return out.getvalue()
+
+
+def encode_image(image, image_format="png"):
+    # Pillow 影像（raster 輕量繪圖）依相同的格式規則編碼
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    buf = _buffer()
+    if image_format == "jpeg":
+        image.save(buf, format="jpeg", quality=85, optimize=True)
+    elif image_format == "png8":
+        image.quantize(256).save(buf, format="png", optimize=True)
+    else:
+        image.save(buf, format="png", compress_level=1)
+    return buf.getvalue()
+
+
+def draw_histogram(ax, counts, edges, color="lightblue", edgecolor="black"):
+    # 預先分箱的 histogram：整條外框一個 Polygon、分隔線一個 LineCollection，
+    # 不像 ax.hist / ax.bar 每一格都建一個 Rectangle（上千格時繪圖時間差數倍）
+    counts = np.asarray(counts, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    ax.stairs(counts, edges, fill=True, color=color)
+    ax.stairs(counts, edges, baseline=0, color=edgecolor, linewidth=1.0)
+    if len(counts) > 1:
+        ax.vlines(edges[1:-1], 0, np.maximum(counts[:-1], counts[1:]), color=edgecolor, linewidth=1.0)
+    return ax
+
+
+def draw_kde(ax, grid, density, color="blue", linewidth=1.5, alpha=0.3):
+    # 預先算好的 KDE 曲線，外觀與 seaborn.kdeplot(fill=True) 相同：半透明填色、不透明外框
+    from matplotlib.colors import to_rgba
+    ax.fill_between(grid, 0, density, facecolor=to_rgba(color, alpha), edgecolor=color, linewidth=linewidth)
+    ax.set_ylim(bottom=0)
+    return ax
@@ -0,0 +1,133 @@
+import copy
+import hashlib
+import json
+from io import BytesIO
+from docx import Document
+from docx.oxml.ns import qn
+from cache import column_fingerprint
+
+# 🔁 更新模式：以資料指紋比對前一版報告，只重建新增或變動的變數章節，
+#    其餘章節（含圖片）直接從前一版 .docx 複製過來
+FINGERPRINT_VERSION = 1
+
+
+def _hash(value):
+    return hashlib.blake2b(json.dumps(value, ensure_ascii=False, default=str).encode(), digest_size=16).hexdigest()
+
+
+def codebook_fingerprint(df, column_types, section_meta, options):
+    # section_meta：依 codebook 順序的 [(col, var_name, type_code, description, defs), ...]
+    variables = {}
+    for col, type_code in column_types.items():
+        if col not in df.columns:
+            continue
+        series = df[col]
+        variables[col] = {
+            "data": _hash([column_fingerprint(series), type_code]),
+            "total": int(len(series)),
+            "na_count": int(series.isna().sum()),
+        }
+    for col, var_name, type_code, description, defs in section_meta:
+        variables[col]["meta"] = _hash([var_name, type_code, description, sorted(map(str, defs.items()))])
+    return {
+        "version": FINGERPRINT_VERSION,
+        "options": _hash(options),
+        "sections": [meta[0] for meta in section_meta],
+        "variables": variables,
+    }
+
+
+def load_fingerprint(source):
+    if isinstance(source, dict):
+        return source
+    if hasattr(source, "read"):
+        return json.load(source)
+    with open(source, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_fingerprint(fingerprint, target):
+    if hasattr(target, "write"):
+        target.write(json.dumps(fingerprint, ensure_ascii=False).encode("utf-8"))
+        return target
+    with open(target, "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f, ensure_ascii=False)
+    return target
+
+
+def diff_fingerprints(old, new):
+    # 回傳 {"added": [...], "removed": [...], "changed": [...], "unchanged": [...]}（依新報告章節順序）
+    old_vars = old.get("variables", {}) if old else {}
+    same_options = bool(old) and old.get("version") == new["version"] and old.get("options") == new["options"]
+    result = {"added": [], "removed": [], "changed": [], "unchanged": []}
+    for col in new["sections"]:
+        before = old_vars.get(col)
+        if before is None or col not in old.get("sections", []):
+            result["added"].append(col)
+        elif same_options and before.get("data") == new["variables"][col]["data"] \
+                and before.get("meta") == new["variables"][col]["meta"]:
+            result["unchanged"].append(col)
+        else:
+            result["changed"].append(col)
+    result["removed"] = [col for col in (old or {}).get("sections", []) if col not in new["sections"]]
+    return result
+
+
+def _is_variable_heading(element):
+    if element.tag != qn("w:p"):
+        return False
+    style = element.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+    if style is None or style.get(qn("w:val")) != "Heading2":
+        return False
+    return "".join(t.text or "" for t in element.iter(qn("w:t"))).startswith("Variable: ")
+
+
+def extract_sections(previous_report, previous_fingerprint):
+    # 前一版報告中第 k 個「Variable:」標題對應指紋記錄的第 k 個章節；回傳 (document, {col: [標題後的元素]})
+    if isinstance(previous_report, (bytes, bytearray)):
+        previous_report = BytesIO(previous_report)
+    old_doc = Document(previous_report)
+    order = previous_fingerprint.get("sections", [])
+    sections, current, k = {}, None, 0
+    for element in old_doc.element.body.iterchildren():
+        if element.tag == qn("w:sectPr"):
+            break
+        if element.tag == qn("w:p") and _is_variable_heading(element):
+            current = order[k] if k < len(order) else None
+            k += 1
+            if current is not None:
+                sections[current] = []
+            continue
+        if element.tag == qn("w:p"):
+            style = element.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+            if style is not None and style.get(qn("w:val")) in ("Heading1", "Heading2"):
+                current = None
+                continue
+        if current is not None:
+            sections[current].append(element)
+    if k != len(order):
+        return old_doc, {}  # 章節數與指紋不符，代表報告不是由這份指紋產生，全部重建
+    return old_doc, sections
+
+
+def splice_section(doc, old_doc, elements):
+    # 將前一版的章節元素複製到新文件；圖片關聯（r:embed）與繪圖物件 id 需重新對應
+    body = doc.element.body
+    sect_pr = body.find(qn("w:sectPr"))
+    next_id = doc.part.next_id
+    for element in elements:
+        element = copy.deepcopy(element)
+        for blip in element.iter(qn("a:blip")):
+            old_rid = blip.get(qn("r:embed"))
+            if old_rid is None:
+                continue
+            blob = old_doc.part.related_parts[old_rid].blob
+            new_rid, _ = doc.part.get_or_add_image(BytesIO(blob))
+            blip.set(qn("r:embed"), new_rid)
+        for doc_pr in element.iter(qn("wp:docPr")):
+            doc_pr.set("id", str(next_id))
+            next_id += 1
+        if sect_pr is not None:
+            sect_pr.addprevious(element)
+        else:
+            body.append(element)
@@ -0,0 +1,140 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ⏳ 背景產出報告的工作佇列：每個工作有自己的輸出目錄（多位使用者不會覆寫同一個 codebook.docx），
+#    產生器每完成一個變數就回報進度，取消時在下一次回報進度時中止。
+#    使用 thread pool：資料表不必複製到子行程；繪圖走 Agg canvas／Pillow，不經過 pyplot 的全域狀態。
+#    in_memory=True 時報告直接寫進記憶體緩衝區（不落地），由 Job.data() 取出位元組
+DEFAULT_WORKERS = 2
+KEEP_SECONDS = 3600  # 完成的工作與輸出檔保留多久
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, label, directory, file_name):
+        self.id = job_id
+        self.label = label
+        self.directory = directory
+        self.file_name = file_name
+        self.output_path = os.path.join(directory, file_name) if directory else None
+        self.output = None  # in_memory 模式的 BytesIO
+        self.status = "queued"  # queued → running → done / failed / cancelled
+        self.done = 0
+        self.total = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def progress(self, done, total, message=""):
+        # 產生器的 progress callback；已要求取消時丟出 JobCancelled 中止產出
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done, self.total, self.message = done, total, message
+
+    @property
+    def fraction(self):
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def data(self):
+        # 產出的檔案內容（記憶體模式直接取緩衝區，否則讀檔）
+        if self.output is not None:
+            return self.output.getvalue()
+        with open(self.output_path, "rb") as f:
+            return f.read()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+            self.finished = time.time()
+
+
+class JobManager:
+    def __init__(self, max_workers=DEFAULT_WORKERS, output_dir=None, keep_seconds=KEEP_SECONDS):
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix="codebook-jobs-")
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="codebook-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def submit(self, func, *args, label="", file_name="codebook.docx", in_memory=False, **kwargs):
+        # func 需接受 output_path 與 progress 參數（generate_codebook／generate_codebook_fast／generate_codebook_chunked）；
+        # in_memory=True 時 output_path 傳入 BytesIO（python-docx 的 save 可直接寫入檔案物件）
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        directory = None
+        if not in_memory:
+            directory = os.path.join(self.output_dir, job_id)
+            os.makedirs(directory)
+        job = Job(job_id, label, directory, file_name)
+        if in_memory:
+            job.output = io.BytesIO()
+        kwargs.update(output_path=job.output if in_memory else job.output_path, progress=job.progress)
+        with self._lock:
+            self._jobs[job_id] = job
+        job.future = self._pool.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        if job._cancel.is_set():
+            return
+        job.status = "running"
+        try:
+            job.result = func(*args, **kwargs)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if job.status != "done":
+                job.output = None  # 未完成的記憶體緩衝區立即釋放
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cleanup(self):
+        # 移除超過保留時間的已完成工作與其輸出目錄
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and now - job.finished > self.keep_seconds]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            job.output = None
+            if job.directory is not None:
+                shutil.rmtree(job.directory, ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        for job in list(self._jobs.values()):
+            if job.active:
+                job.cancel()
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,261 @@
+import datetime
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from metadata import resolve_variables
+from streaming import ENCODINGS, encoding_candidates
+
+# 📂 主資料與 code.csv 的讀取與清理（App 與命令列批次模式共用，規則與 App 上傳流程相同）
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINES = ["pyarrow", "c"]
+except ImportError:
+    CSV_ENGINES = ["c"]
+
+
+def _first_values(df):
+    # 每個 object 欄位的第一個非缺失值（用來判斷 pyarrow 推斷出的型別）
+    for col in range(df.shape[1]):
+        series = df.iloc[:, col]
+        if series.dtype == object:
+            first = series.dropna()[:1]
+            if len(first):
+                yield first.iloc[0]
+
+
+def _needs_c_engine(df):
+    # pyarrow 引擎與預設 C 引擎結果不同的情況：空白／重複欄名不會改成 Unnamed: n、name.1，
+    # 日期時間會自動轉型；遇到時改用 C 引擎重讀，確保報告內容與原本一致
+    names = [str(name) for name in df.columns]
+    if "" in names or len(set(names)) != len(names):
+        return True
+    if any(pd.api.types.is_datetime64_any_dtype(dtype) for dtype in df.dtypes):
+        return True
+    return any(isinstance(value, (datetime.date, datetime.time)) for value in _first_values(df))
+
+
+def _parse_csv(source, encoding, engine):
+    # C 引擎預設的浮點解析與 pyarrow 可能差最後一位，改用 round_trip，兩種引擎讀出的數值相同
+    if hasattr(source, "seek"):
+        source.seek(0)
+    try:
+        options = {"float_precision": "round_trip"} if engine == "c" else {}
+        return pd.read_csv(source, encoding=encoding, engine=engine, **options)
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def read_csv(source, encoding=None):
+    # 以檔頭樣本（64 KB）判斷編碼後只做一次完整解析（有 pyarrow 時用多執行緒的 pyarrow 引擎）；
+    # 樣本判斷錯誤（例如前段全是 ASCII、big5 字元在後面才出現）時才依序改試其他編碼。
+    # source 可為路徑或上傳的檔案物件；全部失敗時丟出 ValueError
+    for enc in encoding_candidates(source, encoding):
+        for engine in CSV_ENGINES:
+            try:
+                df = _parse_csv(source, enc, engine)
+            except UnicodeDecodeError:
+                break  # 編碼不對，換引擎也一樣，直接試下一個編碼
+            except ValueError:  # ParserError 與 pyarrow 的 ArrowInvalid：改用下一個引擎
+                continue
+            if engine == "pyarrow":
+                # pyarrow 遇到無法以此編碼解碼的欄位不會報錯，而是讀成 bytes：視同編碼錯誤
+                if any(isinstance(value, bytes) for value in _first_values(df)):
+                    break
+                if _needs_c_engine(df):
+                    continue
+            return df
+    raise ValueError(f"{getattr(source, 'name', source)}: 無法以 {', '.join(ENCODINGS)} 讀取")
+
+
+# 🧊 欄式格式：Parquet 與 Feather／Arrow IPC，只讀 code.csv 用到的欄位；檔案路徑以 memory map 開啟
+COLUMNAR_EXTENSIONS = {".parquet": "parquet", ".pq": "parquet", ".feather": "arrow", ".arrow": "arrow", ".ipc": "arrow"}
+DATA_FILE_TYPES = ["csv"] + [ext[1:] for ext in COLUMNAR_EXTENSIONS]
+
+
+def input_kind(name):
+    return COLUMNAR_EXTENSIONS.get(os.path.splitext(str(name))[1].lower(), "csv")
+
+
+def _arrow_source(source):
+    # 路徑 → memory map（沒讀到的欄位不會載入記憶體）；上傳檔 → 直接包裝既有的記憶體緩衝區，不另外複製
+    import pyarrow as pa
+    if isinstance(source, (str, os.PathLike)):
+        return pa.memory_map(os.fspath(source), "r")
+    return pa.BufferReader(source.getbuffer())
+
+
+def _open_ipc(source):
+    # Feather v2／Arrow IPC 檔案格式可隨機讀取；串流格式只能依序讀
+    import pyarrow as pa
+    try:
+        return pa.ipc.open_file(_arrow_source(source))
+    except pa.ArrowInvalid:
+        return pa.ipc.open_stream(_arrow_source(source))
+
+
+def columnar_columns(source, kind):
+    # 只讀 schema，不載入任何資料
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(_arrow_source(source)).schema_arrow.names)
+    return list(_open_ipc(source).schema.names)
+
+
+def read_columnar(source, kind, columns=None, nrows=None):
+    # columns：要讀的欄位（比對時去除前後空白，與 clean_data 一致）；None 表示全部
+    # nrows：只讀前幾列（預覽用，只解碼第一個 row group／record batch）
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    names = columnar_columns(source, kind)
+    if columns is not None:
+        wanted = {str(col).strip() for col in columns}
+        names = [name for name in names if str(name).strip() in wanted]
+
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(_arrow_source(source))
+        if nrows is not None:
+            schema = pa.schema([parquet.schema_arrow.field(name) for name in names])
+            batches = list(itertools.islice(parquet.iter_batches(batch_size=nrows, columns=names), 1))
+            table = pa.Table.from_batches(batches, schema=schema)
+        else:
+            table = parquet.read(columns=names, use_pandas_metadata=True)
+    else:
+        reader = _open_ipc(source)
+        file_format = isinstance(reader, pa.ipc.RecordBatchFileReader)
+        if nrows is not None:
+            if file_format:
+                batches = [reader.get_batch(0)] if reader.num_record_batches else []
+            else:
+                batches = list(itertools.islice(reader, 1))
+            table = pa.Table.from_batches(batches, schema=reader.schema).select(names)
+        elif file_format:
+            import pyarrow.feather as feather
+            memory_map = isinstance(source, (str, os.PathLike))
+            table = feather.read_table(source if memory_map else _arrow_source(source), columns=names, memory_map=memory_map)
+        else:
+            table = reader.read_all().select(names)
+
+    # 字典編碼欄位還原成一般值：否則 pandas 會轉成 category，value_counts 會列出未出現的類別
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, pc.cast(table.column(i), field.type.value_type))
+    df = table.to_pandas()
+    if nrows is not None:
+        df = df.head(nrows)
+    # 欄式檔案沒有 CSV 匯出時的空白列，只整理欄名（不做 dropna，避免依讀入的部分欄位判斷整列為空）
+    df.columns = df.columns.astype(str).str.strip()
+    return df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+
+def read_data_file(path, columns=None):
+    # 依副檔名讀入主資料：CSV 全部解析後清理；欄式格式只讀 columns 指定的欄位
+    kind = input_kind(path)
+    if kind == "csv":
+        return clean_data(read_csv(path))
+    return read_columnar(path, kind, columns=columns)
+
+
+def clean_data(df):
+    # 去除全空列、欄名去空白、移除 Unnamed 欄位
+    df = df.dropna(how="all")
+    df.columns = df.columns.str.strip()
+    return df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+
+def clean_code(code_df):
+    code_df = code_df.dropna(how="all")
+    code_df.columns = code_df.columns.str.strip().str.lower()
+    return code_df
+
+
+def match_variables(df_columns, code_df):
+    # 回傳 (只保留交集變數的 code_df, 交集變數, 只在 code.csv 的變數, 只在主資料的變數)
+    code_vars = code_df["variable"].astype(str).str.strip().tolist()
+    df_vars = list(df_columns)
+    common_vars = list(set(code_vars) & set(df_vars))
+    excluded_vars = sorted(set(code_vars) - set(df_vars))
+    excluded_code_vars = sorted(set(df_vars) - set(code_vars))
+    code_df = code_df[code_df["variable"].astype(str).str.strip().isin(common_vars)].reset_index(drop=True)
+    return code_df, common_vars, excluded_vars, excluded_code_vars
+
+
+# 🪶 產出報告前的資料整理：只保留要分析的欄位，類別欄位轉成 category，數值欄位無損降位
+#    統計一律以 float64 計算，降位不會改變報告中的任何數字
+CATEGORY_MAX_RATIO = 0.5  # 不重複值超過列數一半時轉成 category 反而更占記憶體
+
+
+def _to_category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series):
+        return series
+    codes, uniques = pd.factorize(series)
+    if len(uniques) > len(series) * CATEGORY_MAX_RATIO:
+        return series
+    # 類別順序即首次出現順序，不需排序（混合型別的值也能轉換）
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=series.index, name=series.name)
+
+
+def _downcast(series):
+    # 整數改用可容納所有值的最小整數型別；浮點數只有在 float32 能完整表示每個值時才轉換
+    if not isinstance(series.dtype, np.dtype) or pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+    if pd.api.types.is_float_dtype(series) and series.dtype.itemsize > 4:
+        values = series.to_numpy()
+        with np.errstate(over="ignore"):
+            small = values.astype(np.float32)
+        if np.array_equal(small.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(small, index=series.index, name=series.name)
+    return series
+
+
+def prepare_frame(df, column_types):
+    # 回傳 (整理後的 df, {"before": 原始位元組數, "after": 整理後位元組數})；原本的 df 不會被修改
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    columns = [col for col in column_types if col in df.columns]
+    prepared = pd.DataFrame({
+        col: _to_category(df[col]) if column_types[col] == 2 else _downcast(df[col])
+        for col in columns
+    }, index=df.index)
+    after = int(prepared.memory_usage(index=True, deep=True).sum())
+    return prepared, {"before": before, "after": after}
+
+
+def format_memory(memory):
+    saved = memory["before"] - memory["after"]
+    ratio = saved / memory["before"] if memory["before"] else 0.0
+    return (f"{memory['before'] / 2**20:,.1f} MB → {memory['after'] / 2**20:,.1f} MB"
+            f"（節省 {saved / 2**20:,.1f} MB，{ratio:.0%}）")
+
+
+def load_dataset(data_path, code_path):
+    # 讀入一組（主資料, code.csv），回傳產生器需要的參數與提示訊息
+    code_df = clean_code(read_csv(code_path))
+    if "variable" not in code_df.columns or "type" not in code_df.columns:
+        raise ValueError(f"{code_path}: code.csv 需包含 'Variable' 與 'Type' 欄位")
+    if input_kind(data_path) == "csv":
+        df = read_data_file(data_path)
+        data_columns = df.columns
+    else:  # 欄式格式只讀 code.csv 列出的欄位；比對落選變數仍以檔案完整欄位清單為準
+        df = read_data_file(data_path, columns=code_df["variable"].astype(str).str.strip())
+        data_columns = [str(name).strip() for name in columnar_columns(data_path, input_kind(data_path))]
+        data_columns = [name for name in data_columns if not name.startswith("Unnamed")]
+    code_df, common_vars, excluded_vars, excluded_code_vars = match_variables(data_columns, code_df)
+    column_types, variable_names, column_roles, warnings = resolve_variables(code_df, data_columns)
+    if excluded_vars:
+        warnings.append(f"⚠️ 有 {len(excluded_vars)} 個變數未在主資料中找到，已被略過：{', '.join(excluded_vars)}")
+    if excluded_code_vars:
+        warnings.append(f"⚠️ 有 {len(excluded_code_vars)} 個變數未在 code 中找到，已被略過：{', '.join(excluded_code_vars)}")
+    df, memory = prepare_frame(df, column_types)
+    return {
+        "df": df,
+        "memory": memory,
+        "code_df": code_df,
+        "column_types": column_types,
+        "variable_names": variable_names,
+        "column_roles": column_roles,
+        "warnings": warnings,
+    }
@@ -0,0 +1,83 @@
+# 🗂️ code.csv 的 metadata 索引：一次掃描建立 variable → {description, type, target}，
+#    取代每個變數都對整份 code_df 做一次篩選（變數多時是 O(n²)）
+DESCRIPTION_COLUMNS = ["description", "desc", "說明"]
+TARGET_VALUES = ["y", "yes", "target", "1"]
+SKIP_TYPES = ["", "0", "none"]
+NUMERICAL_TYPES = ["1", "numerical", "連續"]
+CATEGORICAL_TYPES = ["2", "categorical", "類別"]
+
+
+def _column(code_df, name):
+    return code_df[name].tolist() if name in code_df.columns else [None] * len(code_df)
+
+
+def build_metadata_index(code_df):
+    # 同一變數出現多次時以第一列為準（與原本 row_match.iloc[0] 相同）；
+    # key 為 code_df 中 variable 的原始值，查詢方式與原本 code_df["variable"] == col 一致
+    index = {}
+    if code_df is None or "variable" not in code_df.columns:
+        return index
+    desc_col = next((c for c in DESCRIPTION_COLUMNS if c in code_df.columns), None)
+    for variable, description, type_value, target in zip(
+        code_df["variable"].tolist(), _column(code_df, desc_col) if desc_col else [None] * len(code_df),
+        _column(code_df, "type"), _column(code_df, "target"),
+    ):
+        if variable in index:
+            continue
+        index[variable] = {
+            "description": str(description) if desc_col else None,
+            "type": type_value,
+            "target": target,
+        }
+    return index
+
+
+def lookup_description(index, col):
+    entry = index.get(col)
+    return entry["description"] if entry is not None else None
+
+
+def resolve_variables(code_df, df_columns):
+    # 依 code.csv 逐列決定 column_types（1 數值／2 類別）、variable_names（X1…/Y1…）與角色，
+    # 規則與原本 App 的 iterrows 迴圈相同；回傳 (column_types, variable_names, column_roles, warnings)
+    df_columns = set(df_columns)
+    has_target = "target" in code_df.columns
+    column_types, variable_names, column_roles, warnings = {}, {}, {}, []
+    x_counter = y_counter = 1
+
+    for variable, type_value, target in zip(
+        code_df["variable"].tolist(), _column(code_df, "type"), _column(code_df, "target")
+    ):
+        col = str(variable).strip()
+        t = str(type_value).strip().lower()
+        target = str(target if has_target else "").strip().lower()
+
+        if col not in df_columns:
+            continue  # 雙保險防呆
+
+        if target in TARGET_VALUES:
+            column_roles[col] = f"Y{y_counter}"
+            variable_names[col] = f"Y{y_counter}"
+            # 根據 type 欄位設定 column_types
+            column_types[col] = 2 if t in CATEGORICAL_TYPES else 1  # 預設為數值型
+            y_counter += 1
+            continue
+
+        if t in SKIP_TYPES:
+            continue  # 自動略過
+
+        if t in NUMERICAL_TYPES:
+            column_roles[col] = f"X{x_counter}"
+            column_types[col] = 1
+            x_counter += 1
+        elif t in CATEGORICAL_TYPES:
+            column_roles[col] = f"X{x_counter}"
+            column_types[col] = 2
+            x_counter += 1
+        else:
+            warnings.append(f"⚠️ Unknown Type '{t}' for column '{col}' — skipped.")
+            continue
+
+        variable_names[col] = column_roles.get(col, col)
+
+    return column_types, variable_names, column_roles, warnings
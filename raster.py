@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from imaging import encode_image
+
+# ⚡ 輕量點陣繪圖：直接用 Pillow 依預先算好的分箱計數／四分位數畫出 Fast Mode 的三種圖，
+#    不經過 matplotlib 的 figure 建立、tight_layout 與 savefig，單張圖約 1–2 ms
+WIDTH, HEIGHT = 460, 345  # 與 matplotlib 預設 6.4 × 4.8 吋在 72 dpi 時相同
+DPI = 72  # 圖的像素大小固定，不支援其他解析度；圖片格式（png／png8／jpeg）與 matplotlib 路徑相同
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 62, 18, 32, 52
+LIGHTBLUE = (173, 216, 230)
+CORNFLOWERBLUE = (100, 149, 237)
+RED = (255, 0, 0)
+BLACK = (0, 0, 0)
+GRAY = (90, 90, 90)
+WHITE = (255, 255, 255)
+BLUE = (0, 0, 255)
+KDE_FILL = (178, 178, 255)
+FONT_PATH = "font/NotoSerifTC-VariableFont_wght.ttf"
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+
+def _font(size):
+    with _fonts_lock:
+        if size not in _fonts:
+            if os.path.exists(FONT_PATH):
+                _fonts[size] = ImageFont.truetype(FONT_PATH, size)
+            else:
+                _fonts[size] = ImageFont.load_default(size=size)
+        return _fonts[size]
+
+
+def _nice_ticks(lo, hi, count=5):
+    if not np.isfinite(lo) or not np.isfinite(hi):
+        return []
+    if hi == lo:
+        return [lo]
+    raw = (hi - lo) / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    start = math.ceil(lo / step) * step
+    ticks = np.arange(start, hi + step * 1e-9, step)
+    return [0.0 if abs(t) < step * 1e-9 else float(t) for t in ticks]
+
+
+def _format_tick(value):
+    if abs(value) >= 1e5 or (value != 0 and abs(value) < 1e-3):
+        return f"{value:.1e}"
+    return f"{value:g}"
+
+
+class _Canvas:
+    def __init__(self, title, xlabel=None, ylabel=None):
+        self.image = Image.new("RGB", (WIDTH, HEIGHT), WHITE)
+        self.draw = ImageDraw.Draw(self.image)
+        self.left, self.top = MARGIN_LEFT, MARGIN_TOP
+        self.right, self.bottom = WIDTH - MARGIN_RIGHT, HEIGHT - MARGIN_BOTTOM
+        self.draw.text((WIDTH / 2, 8), title, fill=BLACK, font=_font(14), anchor="mt")
+        if xlabel:
+            self.draw.text(((self.left + self.right) / 2, HEIGHT - 6), str(xlabel), fill=BLACK, font=_font(12), anchor="md")
+        if ylabel:
+            label = Image.new("L", (int(self.draw.textlength(ylabel, font=_font(12))) + 4, 16), 0)
+            ImageDraw.Draw(label).text((2, 0), ylabel, fill=255, font=_font(12))
+            label = label.rotate(90, expand=True)
+            self.image.paste(BLACK, (2, int((self.top + self.bottom - label.height) / 2)), label)
+
+    def set_limits(self, xlim, ylim):
+        self.xlim, self.ylim = xlim, ylim
+
+    def x(self, value):
+        lo, hi = self.xlim
+        return self.left + (value - lo) / (hi - lo) * (self.right - self.left)
+
+    def y(self, value):
+        lo, hi = self.ylim
+        return self.bottom - (value - lo) / (hi - lo) * (self.bottom - self.top)
+
+    def y_axis(self):
+        for tick in _nice_ticks(*self.ylim):
+            py = self.y(tick)
+            self.draw.line([(self.left - 4, py), (self.left, py)], fill=BLACK)
+            self.draw.text((self.left - 6, py), _format_tick(tick), fill=BLACK, font=_font(10), anchor="rm")
+
+    def x_axis(self):
+        for tick in _nice_ticks(*self.xlim):
+            px = self.x(tick)
+            self.draw.line([(px, self.bottom), (px, self.bottom + 4)], fill=BLACK)
+            self.draw.text((px, self.bottom + 6), _format_tick(tick), fill=BLACK, font=_font(10), anchor="mt")
+
+    def frame(self):
+        self.draw.rectangle([self.left, self.top, self.right, self.bottom], outline=BLACK)
+
+    def encode(self, image_format="png"):
+        return encode_image(self.image, image_format)
+
+
+def _fit(text, limit, font):
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    while len(text) > 1 and draw.textlength(text, font=font) > limit:
+        text = text[:-1]
+    return text
+
+
+def _padded(lo, hi, ratio=0.05):
+    if hi == lo:
+        return lo - 0.5, hi + 0.5
+    pad = (hi - lo) * ratio
+    return lo - pad, hi + pad
+
+
+def render_histogram(col, counts, edges, xlabel=None, image_format="png"):
+    canvas = _Canvas(f"Histogram of {col}", xlabel=xlabel if xlabel is not None else col, ylabel="Frequency")
+    canvas.set_limits(_padded(float(edges[0]), float(edges[-1])), (0, max(float(np.max(counts)), 1.0) * 1.05))
+    base = canvas.y(0)
+    for count, lo, hi in zip(counts, edges[:-1], edges[1:]):
+        if count > 0:
+            canvas.draw.rectangle([canvas.x(lo), canvas.y(count), canvas.x(hi), base], fill=LIGHTBLUE, outline=BLACK)
+    canvas.x_axis()
+    canvas.y_axis()
+    canvas.frame()
+    return canvas.encode(image_format)
+
+
+def render_kde(col, grid, density, image_format="png"):
+    # 填色等同 seaborn 的 blue、alpha 0.3 疊在白底上
+    canvas = _Canvas(f"KDE Plot of {col}", xlabel=col, ylabel="Density")
+    canvas.set_limits(_padded(float(grid[0]), float(grid[-1]), ratio=0.0), (0, max(float(np.max(density)), 1e-12) * 1.05))
+    points = [(canvas.x(x), canvas.y(y)) for x, y in zip(grid, density)]
+    base = canvas.y(0)
+    canvas.draw.polygon([(points[0][0], base)] + points + [(points[-1][0], base)], fill=KDE_FILL)
+    canvas.draw.line(points, fill=BLUE, width=2)
+    canvas.x_axis()
+    canvas.y_axis()
+    canvas.frame()
+    return canvas.encode(image_format)
+
+
+def render_boxplot(col, box, image_format="png"):
+    fliers = np.asarray(box.get("fliers", []), dtype=float)
+    lo = min([box["whislo"]] + fliers.tolist())
+    hi = max([box["whishi"]] + fliers.tolist())
+    canvas = _Canvas(f"Boxplot of {col}")
+    canvas.set_limits((0.5, 1.5), _padded(float(lo), float(hi)))
+    cx, half, cap = canvas.x(1.0), (canvas.right - canvas.left) * 0.125, (canvas.right - canvas.left) * 0.0625
+    canvas.draw.line([(cx, canvas.y(box["whislo"])), (cx, canvas.y(box["q1"]))], fill=BLACK)
+    canvas.draw.line([(cx, canvas.y(box["q3"])), (cx, canvas.y(box["whishi"]))], fill=BLACK)
+    for value in (box["whislo"], box["whishi"]):
+        canvas.draw.line([(cx - cap, canvas.y(value)), (cx + cap, canvas.y(value))], fill=BLACK)
+    canvas.draw.rectangle([cx - half, canvas.y(box["q3"]), cx + half, canvas.y(box["q1"])], fill=LIGHTBLUE, outline=BLACK)
+    canvas.draw.line([(cx - half, canvas.y(box["med"])), (cx + half, canvas.y(box["med"]))], fill=RED, width=2)
+    for value in fliers:
+        py = canvas.y(value)
+        canvas.draw.ellipse([cx - 3, py - 3, cx + 3, py + 3], outline=BLACK)
+    canvas.draw.text((cx, canvas.bottom + 6), str(col), fill=BLACK, font=_font(10), anchor="mt")
+    canvas.y_axis()
+    canvas.frame()
+    return canvas.encode(image_format)
+
+
+def render_bar(col, labels, counts, image_format="png"):
+    canvas = _Canvas(f"Count Plot of {col}", xlabel=col, ylabel="Frequency")
+    n = max(len(counts), 1)
+    canvas.set_limits((-0.5, n - 0.5), (0, max(float(np.max(counts)) if len(counts) else 0.0, 1.0) * 1.05))
+    base = canvas.y(0)
+    label_every = max(1, math.ceil(n / 30))  # 類別太多時只標部分 x 軸標籤
+    rotate = n > 8
+    limit = MARGIN_BOTTOM - 20 if rotate else (canvas.right - canvas.left) / n - 4
+    for i, (label, count) in enumerate(zip(labels, counts)):
+        canvas.draw.rectangle([canvas.x(i - 0.25), canvas.y(count), canvas.x(i + 0.25), base], fill=CORNFLOWERBLUE)
+        if i % label_every:
+            continue
+        text = _fit(str(label), limit, _font(10))
+        if rotate:
+            mask = Image.new("L", (int(canvas.draw.textlength(text, font=_font(10))) + 2, 14), 0)
+            ImageDraw.Draw(mask).text((1, 0), text, fill=255, font=_font(10))
+            mask = mask.rotate(90, expand=True)
+            canvas.image.paste(BLACK, (int(canvas.x(i) - mask.width / 2), int(canvas.bottom + 3)), mask)
+        else:
+            canvas.draw.text((canvas.x(i), canvas.bottom + 5), text, fill=BLACK, font=_font(10), anchor="mt")
+    canvas.y_axis()
+    canvas.frame()
+    return canvas.encode(image_format)
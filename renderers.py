@@ -0,0 +1,221 @@
+import base64
+import html
+import os
+from io import BytesIO
+
+# 🖨️ 報告輸出格式：產生器只呼叫 heading／paragraph／table／image，不直接操作 python-docx，
+#    同一次統計與繪圖的結果可同時寫成多種格式（output_format=["docx", "html", "md"]）
+#    docx：Word（python-docx 只在需要時載入）；html：單一網頁，圖檔 lazy-load；md：Markdown
+OUTPUT_FORMATS = {"docx": ".docx", "html": ".html", "md": ".md"}
+MIME_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".html": "text/html",
+    ".md": "text/markdown",
+    ".zip": "application/zip",
+}
+HTML_STYLE = (
+    "body{font-family:sans-serif;max-width:60em;margin:2em auto}"
+    "table{border-collapse:collapse;margin:.5em 0}"
+    "td{border:1px solid #000;padding:2px 6px;vertical-align:top}"
+)
+
+
+def mime_type(file_name):
+    return MIME_TYPES.get(os.path.splitext(file_name)[1].lower(), "application/octet-stream")
+
+
+def _image_type(data):
+    return ("jpeg", "image/jpeg") if data[:2] == b"\xff\xd8" else ("png", "image/png")
+
+
+def _grid(rows, spans):
+    # 與 tables.add_table 相同的合併格規則；合併掉的格以 None 佔位（HTML 略過、Markdown 留空）
+    spans = spans or {}
+    grid = []
+    for r, row in enumerate(rows):
+        cells = []
+        for j, text in enumerate(row):
+            span = spans.get((r, j), 1)
+            cells.append((str(text), span))
+            cells.extend([(None, 1)] * (span - 1))
+        grid.append(cells)
+    width = max(len(cells) for cells in grid)
+    return [cells + [("", 1)] * (width - len(cells)) for cells in grid]
+
+
+class DocxRenderer:
+    extension = ".docx"
+
+    def __init__(self):
+        from docx import Document
+        self.doc = Document()
+
+    def heading(self, text, level):
+        self.doc.add_heading(text, level=level)
+
+    def paragraph(self, text):
+        self.doc.add_paragraph(text)
+
+    def table(self, rows, spans=None):
+        from tables import add_table
+        add_table(self.doc, rows, spans=spans)
+
+    def image(self, data, width):
+        from docx.shared import Inches
+        self.doc.add_picture(BytesIO(data), width=Inches(width))
+
+    def save(self, output):
+        self.doc.save(output)
+
+
+class _TextRenderer:
+    # 文字格式共用：內容先累積成片段，圖檔位置以 (index, width) 佔位，存檔時才決定引用方式。
+    # 輸出為路徑時圖檔另存於 <檔名>_files/ 並以相對路徑引用；輸出為檔案物件時改以 data URI 內嵌
+    extension = ""
+
+    def __init__(self):
+        self.parts = []
+        self.images = []
+
+    def image(self, data, width):
+        self.images.append(data)
+        self.parts.append((len(self.images) - 1, width))
+
+    def _sources(self, output):
+        if not isinstance(output, (str, os.PathLike)):
+            return [f"data:{_image_type(data)[1]};base64,{base64.b64encode(data).decode()}" for data in self.images]
+        stem = os.path.splitext(os.path.basename(os.fspath(output)))[0]
+        folder = os.path.join(os.path.dirname(os.fspath(output)), f"{stem}_files")
+        if self.images:
+            os.makedirs(folder, exist_ok=True)
+        sources = []
+        for i, data in enumerate(self.images, 1):
+            name = f"figure{i:04d}.{_image_type(data)[0]}"
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(data)
+            sources.append(f"{stem}_files/{name}")
+        return sources
+
+    def save(self, output):
+        sources = self._sources(output)
+        text = self._document([
+            part if isinstance(part, str) else self._image(sources[part[0]], part[1]) for part in self.parts
+        ])
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            output.write(text.encode("utf-8"))
+
+
+class HtmlRenderer(_TextRenderer):
+    extension = ".html"
+
+    def heading(self, text, level):
+        self.parts.append(f"<h{level}>{html.escape(text)}</h{level}>")
+
+    def paragraph(self, text):
+        self.parts.append(f"<p>{html.escape(text)}</p>")
+
+    def table(self, rows, spans=None):
+        lines = ["<table>"]
+        for cells in _grid(rows, spans):
+            tds = []
+            for text, span in cells:
+                if text is None:
+                    continue
+                colspan = f" colspan=\"{span}\"" if span > 1 else ""
+                tds.append(f"<td{colspan}>" + html.escape(text).replace("\n", "<br>") + "</td>")
+            lines.append("<tr>" + "".join(tds) + "</tr>")
+        lines.append("</table>")
+        self.parts.append("\n".join(lines))
+
+    def _image(self, source, width):
+        return f"<p><img src=\"{source}\" width=\"{round(width * 96)}\" loading=\"lazy\" alt=\"\"></p>"
+
+    def _document(self, parts):
+        return ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>Codebook</title>\n"
+                f"<style>{HTML_STYLE}</style>\n</head>\n<body>\n" + "\n".join(parts) + "\n</body>\n</html>\n")
+
+
+class MarkdownRenderer(_TextRenderer):
+    extension = ".md"
+
+    def heading(self, text, level):
+        self.parts.append(f"{'#' * level} {text}")
+
+    def paragraph(self, text):
+        self.parts.append(text)
+
+    def table(self, rows, spans=None):
+        # Markdown 表格沒有合併格：合併掉的格留空；第一列作為表頭
+        grid = [[(text or "").replace("|", "\\|").replace("\n", "<br>") for text, _ in cells]
+                for cells in _grid(rows, spans)]
+        lines = ["| " + " | ".join(grid[0]) + " |", "|" + "---|" * len(grid[0])]
+        lines.extend("| " + " | ".join(cells) + " |" for cells in grid[1:])
+        self.parts.append("\n".join(lines))
+
+    def _image(self, source, width):
+        return f"![]({source})"
+
+    def _document(self, parts):
+        return "\n\n".join(parts) + "\n"
+
+
+RENDERERS = {"docx": DocxRenderer, "html": HtmlRenderer, "md": MarkdownRenderer}
+
+
+def output_formats(output_format):
+    formats = [output_format] if isinstance(output_format, str) else list(output_format)
+    unknown = [fmt for fmt in formats if fmt not in RENDERERS]
+    if unknown or not formats:
+        raise ValueError(f"output_format 需為 {', '.join(RENDERERS)}：{', '.join(unknown)}")
+    return list(dict.fromkeys(formats))
+
+
+def output_paths(output_path, formats):
+    # 檔案物件：直接寫入（只能一種格式）；{格式: 路徑或檔案物件}：逐一對應；
+    # 路徑：依格式換副檔名（codebook.docx → codebook.html、codebook.md），單一格式也一樣；
+    # 副檔名不是報告格式時，單一格式照原路徑寫入
+    if isinstance(output_path, dict):
+        return {fmt: output_path[fmt] for fmt in formats}
+    if not isinstance(output_path, (str, os.PathLike)):
+        if len(formats) == 1:
+            return {formats[0]: output_path}
+        raise ValueError("多種輸出格式需提供檔案路徑或 {格式: 輸出} 對照")
+    stem, extension = os.path.splitext(os.fspath(output_path))
+    if len(formats) == 1 and extension.lower() not in OUTPUT_FORMATS.values():
+        return {formats[0]: output_path}
+    return {fmt: stem + OUTPUT_FORMATS[fmt] for fmt in formats}
+
+
+class RendererGroup:
+    # 同時寫入多個格式：每個呼叫轉給所有 renderer
+    def __init__(self, output_format="docx"):
+        self.renderers = {fmt: RENDERERS[fmt]() for fmt in output_formats(output_format)}
+
+    def get(self, fmt):
+        return self.renderers.get(fmt)
+
+    def heading(self, text, level):
+        for renderer in self.renderers.values():
+            renderer.heading(text, level)
+
+    def paragraph(self, text):
+        for renderer in self.renderers.values():
+            renderer.paragraph(text)
+
+    def table(self, rows, spans=None):
+        for renderer in self.renderers.values():
+            renderer.table(rows, spans=spans)
+
+    def image(self, data, width):
+        for renderer in self.renderers.values():
+            renderer.image(data, width)
+
+    def save(self, output_path):
+        # 回傳寫入的位置：單一格式為該路徑／檔案物件，多種格式為 {格式: 路徑}
+        paths = output_paths(output_path, list(self.renderers))
+        for fmt, renderer in self.renderers.items():
+            renderer.save(paths[fmt])
+        return paths[next(iter(paths))] if len(paths) == 1 else paths
@@ -0,0 +1,54 @@
+import zipfile
+
+# 🧩 大型 codebook 分割輸出：變數依數量、X/Y 角色或類型分成多份文件，每份在自己的 worker 建立並存檔，
+#    再與索引文件（index.docx）一起打包成 zip；每份文件的建立時間與記憶體只取決於該份的變數數
+SHARD_MODES = ["count", "role", "type"]
+DEFAULT_SHARD_SIZE = 200  # 每份文件最多幾個變數
+INDEX_NAME = "index.docx"
+TYPE_GROUPS = {1: "numerical", 2: "categorical"}
+
+
+def _group(section, shard_by, column_roles):
+    if shard_by == "role":
+        # column_roles 為 X1…/Y1…；沒有傳入時以 variable_names（同樣是 X/Y 編號）判斷
+        role = str(column_roles.get(section["col"], section["var_name"]))
+        return "Y" if role.startswith("Y") else "X"
+    if shard_by == "type":
+        return TYPE_GROUPS.get(section["type_code"], str(section["type_code"]))
+    return ""
+
+
+def plan_shards(sections, shard_by="count", shard_size=DEFAULT_SHARD_SIZE, column_roles=None):
+    # 回傳 [{"group", "label", "file_name", "sections"}]；同組變數維持 codebook 順序，超過 shard_size 再切成多份
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"shard_by 需為 {', '.join(SHARD_MODES)} 之一：{shard_by}")
+    shard_size = max(1, int(shard_size))
+    groups = {}
+    for section in sections:
+        groups.setdefault(_group(section, shard_by, column_roles or {}), []).append(section)
+    if shard_by == "role":  # 目標變數（Y）放在最前面
+        groups = dict(sorted(groups.items(), key=lambda item: item[0] != "Y"))
+
+    shards = []
+    for group, members in groups.items():
+        for start in range(0, len(members), shard_size):
+            shards.append({"group": group, "sections": members[start:start + shard_size]})
+    width = max(2, len(str(len(shards))))
+    for i, shard in enumerate(shards, 1):
+        group = shard["group"]
+        shard["label"] = f"Part {i}/{len(shards)}" + (f" ({group})" if group else "")
+        shard["file_name"] = f"codebook_part{i:0{width}d}" + (f"_{group}" if group else "") + ".docx"
+    return shards
+
+
+def bundle_path(output_path):
+    # 分割輸出為 zip：路徑以 .docx 結尾時改為 .zip；檔案物件（BytesIO）直接寫入
+    if isinstance(output_path, str) and output_path.lower().endswith(".docx"):
+        return output_path[:-len(".docx")] + ".zip"
+    return output_path
+
+
+def open_bundle(output_path):
+    # docx 本身已經過 zip 壓縮，打包時直接儲存（ZIP_STORED），不再壓縮一次；
+    # 呼叫端每完成一份文件就寫入（writestr），不必等全部完成
+    return zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED)
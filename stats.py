@@ -0,0 +1,270 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+# 📦 一次處理的數值欄位數，避免 1M 列 × 300 欄一次轉成一整塊 float64 矩陣；
+#    列數多時再依位元組上限縮小（1M 列約 8 欄一塊），區塊與其暫存副本不會抵銷 float32 降位省下的記憶體
+NUMERIC_BLOCK_SIZE = 64
+NUMERIC_BLOCK_BYTES = 64 << 20
+# 缺失索引只需保留前幾筆給報告預覽（報告顯示 5 筆，第 6 筆用來判斷是否加 "..."）
+MISSING_INDEX_PREVIEW = 6
+# 整數檢查以列為單位分段進行，不用為整個區塊再配置一份 trunc 後的副本
+ROW_CHUNK = 1 << 16
+# Boxplot 最多保留的離群值數量；圖上畫的點數不再隨資料列數成長
+MAX_FLIERS = 500
+# 整數型資料每個整數一格；範圍超過此數（例如流水號）就改用自動分箱
+MAX_INTEGER_BINS = 10_000
+# KDE：與 seaborn.kdeplot 預設相同的 200 點網格、Scott 頻寬、兩端各延伸 3 個頻寬；
+# 先把資料線性分箱到固定格數再以 FFT 卷積，成本只與格數有關，不再是 O(資料列數 × 網格)
+KDE_GRIDSIZE = 200
+KDE_CUT = 3
+KDE_MIN_BINS = 512
+KDE_MAX_BINS = 1 << 16
+# 預覽模式：計數、缺失、平均、標準差、極值用全部資料；分位數與圖由分層抽樣估計，
+# 誤差以 DKW 不等式給出（樣本 CDF 與全體 CDF 的最大差距，信心水準 95%）
+PREVIEW_SAMPLE_SIZE = 100_000
+PREVIEW_CONFIDENCE = 0.95
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def to_float_array(series):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype="float64", na_value=np.nan)
+    try:
+        return pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    except Exception:
+        return np.full(len(series), np.nan)
+
+
+def _missing_preview(index, mask):
+    positions = np.flatnonzero(mask)[:MISSING_INDEX_PREVIEW]
+    return index[positions].tolist()
+
+
+def _integer_columns(block, nan_mask):
+    result = np.ones(block.shape[1], dtype=bool)
+    for start in range(0, block.shape[0], ROW_CHUNK):
+        part = block[start:start + ROW_CHUNK]
+        result &= np.all((part == np.rint(part)) | nan_mask[start:start + ROW_CHUNK], axis=0)
+        if not result.any():
+            break
+    return result
+
+
+def stratified_sample(n, size, seed=0):
+    # 依列順序切成 size 個等長區段、每段隨機取一列：同一個 seed 結果相同，
+    # 樣本平均分布在整份資料（依時間排序的資料也不會只抽到前段）；樣本不比資料小時回傳 None
+    if size is None or size >= n:
+        return None
+    rng = np.random.default_rng(seed)
+    return np.floor((np.arange(size) + rng.random(size)) * (n / size)).astype(np.int64)
+
+
+def dkw_epsilon(m, confidence=PREVIEW_CONFIDENCE):
+    # Dvoretzky–Kiefer–Wolfowitz：P(sup|F_m − F| > ε) ≤ 2·exp(−2mε²)
+    return float(np.sqrt(np.log(2 / (1 - confidence)) / (2 * m))) if m else 1.0
+
+
+def _sample_summary(values, count, seed):
+    # 真實的 p 分位數以 95% 信心落在樣本 p−ε 與 p+ε 分位數之間
+    epsilon = dkw_epsilon(len(values))
+    bounds = np.quantile(values, np.clip([[p - epsilon, p + epsilon] for p in QUANTILES], 0, 1))
+    return {
+        "size": len(values),
+        "population": count,
+        "seed": seed,
+        "confidence": PREVIEW_CONFIDENCE,
+        "epsilon": epsilon,
+        "intervals": {label: tuple(bound) for label, bound in zip(["25%", "50%", "75%"], bounds.tolist())},
+    }
+
+
+def _numeric_block_stats(df, cols, keep_values, kde=False, sample=None, seed=0):
+    # 以欄為主（Fortran order）存放：每欄在記憶體中連續，axis=0 的 nan* 彙總快數倍
+    block = np.empty((len(df), len(cols)), dtype="float64", order="F")
+    for j, col in enumerate(cols):
+        block[:, j] = to_float_array(df[col])
+    nan_mask = np.isnan(block)
+    counts = block.shape[0] - nan_mask.sum(axis=0)
+
+    # 全為缺失的欄位在 nan* 系列函式會發出 RuntimeWarning，結果本來就是 NaN
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        means = np.nanmean(block, axis=0)
+        stds = np.nanstd(block, axis=0, ddof=1)
+        mins = np.nanmin(block, axis=0)
+        maxs = np.nanmax(block, axis=0)
+        is_integer = _integer_columns(block, nan_mask)
+
+    results = {}
+    for j, col in enumerate(cols):
+        count = int(counts[j])
+        column_mask = nan_mask[:, j]
+        raw = df[col]
+        if pd.api.types.is_numeric_dtype(raw) and not pd.api.types.is_bool_dtype(raw):
+            na_count = block.shape[0] - count
+        else:
+            na_count = int(raw.isna().sum())
+        entry = {
+            "type": 1,
+            "total": block.shape[0],
+            "na_count": na_count,
+            "count": count,
+            "missing_count": block.shape[0] - count,
+            "missing_index": _missing_preview(df.index, column_mask),
+            "mean": means[j],
+            "std": stds[j],
+            "min": mins[j],
+            "25%": np.nan,
+            "50%": np.nan,
+            "75%": np.nan,
+            "max": maxs[j],
+            "is_integer": bool(is_integer[j]) and count > 0,
+        }
+        if count:
+            # 📐 預先算好分箱計數與 boxplot 摘要，繪圖時不必再傳入整欄原始資料
+            values = block[~column_mask, j]
+            shown = values
+            if sample is not None:
+                sampled = block[sample, j]
+                sampled = sampled[~np.isnan(sampled)]
+                if len(sampled):  # 樣本中全是缺失值時改用全部資料
+                    shown = sampled
+                    entry["sample"] = _sample_summary(sampled, count, seed)
+            # 分位數逐欄以非缺失值計算（nanquantile 會為整個區塊再複製一份）
+            entry["25%"], entry["50%"], entry["75%"] = np.quantile(shown, QUANTILES)
+            frequencies, edges = histogram_counts(shown, entry["is_integer"])
+            if shown is not values:  # 樣本計數依抽樣比例放大成全體的估計次數（與分塊模式的 sketch 相同）
+                frequencies = frequencies * (count / len(shown))
+            entry["hist"] = frequencies, edges
+            entry["box"] = box_summary(shown, entry["25%"], entry["50%"], entry["75%"], max_fliers=MAX_FLIERS)
+            if kde and len(shown) > 1:
+                entry["kde"] = kde_curve(shown)
+            if keep_values:
+                entry["values"] = values
+        results[col] = entry
+    return results
+
+
+def _category_value_counts(series):
+    # category 欄位的 value_counts 會列出未出現的類別、同次數時依類別順序排列；
+    # 這裡改用 codes 計數，結果與一般欄位相同：只列出現過的值，次數相同時依首次出現順序
+    codes = series.cat.codes.to_numpy()
+    present, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    order = order[np.argsort(-counts[order], kind="stable")]
+    present, counts = present[order], counts[order]
+    values = series.cat.categories.take(np.maximum(present, 0)).where(present >= 0)
+    return pd.Series(counts, index=values.rename(series.name), name="count")
+
+
+def _categorical_stats(df, col):
+    series = df[col]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        value_counts = _category_value_counts(series)
+    else:
+        value_counts = series.value_counts(dropna=False)
+    na_mask = series.isna().to_numpy()
+    na_count = int(na_mask.sum())
+    return {
+        "type": 2,
+        "total": len(series),
+        "na_count": na_count,
+        "count": len(series) - na_count,
+        "missing_count": na_count,
+        "missing_index": _missing_preview(df.index, na_mask),
+        "value_counts": value_counts,
+    }
+
+
+def compute_column_stats(df, column_types, keep_values=False, kde=False, block_size=NUMERIC_BLOCK_SIZE,
+                         sample=None, seed=0):
+    # 📊 一次掃描算出所有選取欄位的統計量：數值欄位以 NumPy 向量化分塊處理，
+    #    類別欄位各做一次 value_counts；兩個 codebook 產生器共用此結果
+    #    sample：預覽模式的列位置（stratified_sample），數值欄位的分位數、分箱、boxplot 與 KDE 改由樣本估計
+    valid_cols = [col for col in column_types.keys() if col in df.columns]
+    numeric_cols = [col for col in valid_cols if column_types[col] == 1]
+    categorical_cols = [col for col in valid_cols if column_types[col] == 2]
+
+    stats = {}
+    block_size = max(1, min(block_size, NUMERIC_BLOCK_BYTES // max(1, 8 * len(df))))
+    for start in range(0, len(numeric_cols), block_size):
+        stats.update(_numeric_block_stats(df, numeric_cols[start:start + block_size], keep_values, kde, sample, seed))
+    for col in categorical_cols:
+        stats[col] = _categorical_stats(df, col)
+    for col in valid_cols:
+        if col not in stats:
+            na_count = int(df[col].isna().sum())
+            stats[col] = {"type": column_types[col], "total": len(df), "na_count": na_count,
+                          "count": len(df) - na_count, "missing_count": na_count, "missing_index": []}
+    return {col: stats[col] for col in valid_cols}
+
+
+def missing_summary(stats):
+    # 缺失值摘要：(欄位, 缺失數, 缺失率 %)，只列出有缺失的欄位
+    rows = []
+    for col, entry in stats.items():
+        if entry["na_count"] > 0:
+            rate = float(np.round(entry["na_count"] / entry["total"] * 100, 2)) if entry["total"] else 0.0
+            rows.append((col, entry["na_count"], rate))
+    return rows
+
+
+def histogram_counts(values, is_integer):
+    # 與原本繪圖規則相同：整數型每個整數一格，否則用 numpy 'auto' 分箱
+    if is_integer:
+        # 每格正好一個整數，直接 bincount，不必逐值搜尋分箱邊界；
+        # 分箱位置與邊界都由四捨五入後的值決定（與以 ±0.5 為邊界的分箱相同）
+        index = np.rint(values)
+        lo, hi = index.min(), index.max()
+        if hi - lo < MAX_INTEGER_BINS:
+            counts = np.bincount((index - lo).astype(np.int64), minlength=int(hi - lo) + 1)
+            return counts, np.arange(lo, hi + 2) - 0.5
+    return np.histogram(values, bins="auto")
+
+
+def kde_curve(values, gridsize=KDE_GRIDSIZE, cut=KDE_CUT):
+    # 高斯 KDE 曲線 (grid, density)；變異數為 0 時回傳 None（seaborn 此時也不畫曲線）
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    std = np.std(values, ddof=1) if n > 1 else 0.0
+    if not std > 0:
+        return None
+    bw = std * n ** (-1 / 5)  # Scott's rule，與 scipy.stats.gaussian_kde 預設相同
+    lo, hi = values.min() - cut * bw, values.max() + cut * bw
+    grid = np.linspace(lo, hi, gridsize)
+
+    # 每個頻寬至少 4 格，讓分箱誤差遠小於曲線本身的寬度
+    bins = int(np.clip(np.ceil((hi - lo) / bw * 4), KDE_MIN_BINS, KDE_MAX_BINS))
+    delta = (hi - lo) / (bins - 1)
+    position = (values - lo) / delta
+    left = np.minimum(position.astype(np.int64), bins - 2)
+    weight = position - left
+    counts = (np.bincount(left, weights=1 - weight, minlength=bins)
+              + np.bincount(left + 1, weights=weight, minlength=bins))
+
+    offsets = np.arange(-(bins - 1), bins) * delta
+    kernel = np.exp(-0.5 * (offsets / bw) ** 2)
+    size = 1 << int(np.ceil(np.log2(3 * bins - 2)))
+    smoothed = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)[bins - 1:2 * bins - 1]
+    density = np.maximum(smoothed, 0) / (n * bw * np.sqrt(2 * np.pi))
+    return grid, np.interp(grid, lo + np.arange(bins) * delta, density)
+
+
+def box_summary(values, q1, q2, q3, max_fliers=None):
+    # matplotlib boxplot 的規則：鬚線延伸到 1.5 IQR 內最極端的資料點，其餘為離群值
+    iqr = q3 - q1
+    low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    inside = values[(values >= low) & (values <= high)]
+    fliers = values[(values < low) | (values > high)]
+    if max_fliers is not None and len(fliers) > max_fliers:
+        # 保留最極端的值，其餘等距抽樣，圖上仍看得出分布範圍
+        fliers = np.sort(fliers)
+        picks = np.unique(np.linspace(0, len(fliers) - 1, max_fliers).round().astype(int))
+        fliers = fliers[picks]
+    return {
+        "med": q2, "q1": q1, "q3": q3,
+        "whislo": inside.min() if len(inside) else q1,
+        "whishi": inside.max() if len(inside) else q3,
+        "fliers": fliers,
+    }
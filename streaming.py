@@ -0,0 +1,382 @@
+import io
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from stats import to_float_array, MISSING_INDEX_PREVIEW, MAX_FLIERS, MAX_INTEGER_BINS, box_summary
+
+# 🧱 分塊模式：CSV 以 chunksize 逐塊讀入，每個欄位只保留可合併的累計量，
+#    記憶體用量與檔案大小無關，最後轉成與 stats.compute_column_stats 相同格式的結果
+DEFAULT_CHUNKSIZE = 100_000
+SKETCH_CAPACITY = 2048
+# 整數型欄位的相異值超過此數量就改用 sketch 近似 histogram
+MAX_TRACKED_INTEGERS = 10_000
+ENCODINGS = ["utf-8", "utf-8-sig", "cp950", "big5"]
+
+_NA = object()  # 類別計數中代表缺失值的 key（NaN 不能當 dict key 比對）
+
+
+class QuantileSketch:
+    # 簡化版 KLL sketch：每層最多 capacity 個值，滿了就排序後隨機保留一半升到下一層（權重加倍）
+    def __init__(self, capacity=SKETCH_CAPACITY, seed=0):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.capacity:
+                values = np.sort(values)
+                keep = values[-1:] if len(values) % 2 else values[:0]
+                values = values[:len(values) - len(keep)]
+                promoted = values[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def weighted_values(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    def quantiles(self, qs):
+        # 尚未壓縮過時保有全部資料 → 與 numpy 的線性內插結果完全相同
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], qs)
+        values, weights = self.weighted_values()
+        positions = np.cumsum(weights) - weights / 2
+        return np.interp(np.asarray(qs) * weights.sum(), positions, values)
+
+
+class NumericAggregate:
+    def __init__(self):
+        self.total = 0
+        self.na_count = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.is_integer = True
+        self.integer_counts = {}
+        self.missing_index = []
+        self.sketch = QuantileSketch()
+
+    def update(self, series):
+        values = to_float_array(series)
+        mask = np.isnan(values)
+        self.total += len(values)
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            self.na_count += int(mask.sum())
+        else:
+            self.na_count += int(series.isna().sum())
+        if len(self.missing_index) < MISSING_INDEX_PREVIEW:
+            positions = np.flatnonzero(mask)[:MISSING_INDEX_PREVIEW - len(self.missing_index)]
+            self.missing_index.extend(series.index[positions].tolist())
+
+        values = values[~mask]
+        if not len(values):
+            return
+        chunk = NumericAggregate()
+        chunk.count = len(values)
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        chunk.is_integer = bool(np.all(values == np.rint(values)))
+        if chunk.is_integer:
+            keys, counts = np.unique(np.rint(values), return_counts=True)
+            chunk.integer_counts = dict(zip(keys.tolist(), counts.tolist()))
+        chunk.sketch.update(values)
+        self._merge_moments(chunk)
+
+    def _merge_moments(self, other):
+        # Welford / Chan 平行合併公式
+        if other.count == 0:
+            return
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.is_integer = self.is_integer and other.is_integer
+        if self.is_integer and self.integer_counts is not None and other.integer_counts is not None:
+            for key, value in other.integer_counts.items():
+                self.integer_counts[key] = self.integer_counts.get(key, 0) + value
+            if len(self.integer_counts) > MAX_TRACKED_INTEGERS:
+                self.integer_counts = None
+        else:
+            self.integer_counts = None
+        self.sketch.merge(other.sketch)
+
+    def merge(self, other):
+        self.total += other.total
+        self.na_count += other.na_count
+        self.missing_index = (self.missing_index + other.missing_index)[:MISSING_INDEX_PREVIEW]
+        self._merge_moments(other)
+
+    def _histogram(self, iqr):
+        lo, hi = np.rint(self.min), np.rint(self.max)
+        if self.is_integer and self.integer_counts is not None and hi - lo < MAX_INTEGER_BINS:
+            # 計數的 key 與邊界都取四捨五入後的整數，與 stats.histogram_counts 相同
+            edges = np.arange(lo, hi + 2) - 0.5
+            counts = np.array([self.integer_counts.get(float(v), 0) for v in np.arange(lo, hi + 1)])
+            return counts, edges
+        # 與 numpy 'auto' 相同的規則（FD 與 Sturges 取較窄者），計數由 sketch 的加權樣本估計
+        lo, hi = self.min, self.max
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        sturges = (hi - lo) / (np.log2(self.count) + 1.0)
+        fd = 2.0 * iqr * self.count ** (-1.0 / 3.0)
+        width = min(fd, sturges) if fd > 0 else sturges
+        edges = np.linspace(lo, hi, max(1, int(np.ceil((hi - lo) / width))) + 1)
+        values, weights = self.sketch.weighted_values()
+        counts, _ = np.histogram(values, bins=edges, weights=weights)
+        return counts * (self.count / weights.sum()), edges
+
+    def _box(self, q1, q2, q3):
+        values, _ = self.sketch.weighted_values()
+        values = np.unique(np.concatenate([[self.min], values, [self.max]]))
+        return box_summary(values, q1, q2, q3, max_fliers=MAX_FLIERS)
+
+    def to_stats(self):
+        if self.count:
+            q1, q2, q3 = self.sketch.quantiles([0.25, 0.5, 0.75])
+        else:
+            q1 = q2 = q3 = np.nan
+        entry = {
+            "type": 1,
+            "total": self.total,
+            "na_count": self.na_count,
+            "count": self.count,
+            "missing_count": self.total - self.count,
+            "missing_index": list(self.missing_index),
+            "mean": self.mean if self.count else np.nan,
+            "std": np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan,
+            "min": self.min if self.count else np.nan,
+            "25%": q1,
+            "50%": q2,
+            "75%": q3,
+            "max": self.max if self.count else np.nan,
+            "is_integer": self.is_integer and self.count > 0,
+        }
+        if self.count:
+            entry["hist"] = self._histogram(q3 - q1)
+            entry["box"] = self._box(q1, q2, q3)
+        return entry
+
+
+class CategoricalAggregate:
+    def __init__(self):
+        self.total = 0
+        self.na_count = 0
+        self.counts = {}  # 依首次出現順序，與 value_counts 同值時的排序一致
+        self.missing_index = []
+
+    def update(self, series):
+        mask = series.isna().to_numpy()
+        self.total += len(series)
+        self.na_count += int(mask.sum())
+        if len(self.missing_index) < MISSING_INDEX_PREVIEW:
+            positions = np.flatnonzero(mask)[:MISSING_INDEX_PREVIEW - len(self.missing_index)]
+            self.missing_index.extend(series.index[positions].tolist())
+        for key, value in series.value_counts(dropna=False, sort=False).items():
+            key = _NA if pd.isna(key) else key
+            self.counts[key] = self.counts.get(key, 0) + int(value)
+
+    def merge(self, other):
+        self.total += other.total
+        self.na_count += other.na_count
+        self.missing_index = (self.missing_index + other.missing_index)[:MISSING_INDEX_PREVIEW]
+        for key, value in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def to_stats(self):
+        keys = [key for key in self.counts if key is not _NA]
+        # 類別欄位以字串讀入；若所有類別都是數字就轉回數值，與整份讀入時的型別推斷一致
+        try:
+            index_values = pd.to_numeric(pd.Series(keys, dtype=object)).tolist()
+        except (ValueError, TypeError):
+            index_values = keys
+        mapping = dict(zip(keys, index_values))
+        index = [np.nan if key is _NA else mapping[key] for key in self.counts]
+        value_counts = pd.Series(list(self.counts.values()), index=index, name="count")
+        value_counts = value_counts.sort_values(ascending=False, kind="stable")
+        return {
+            "type": 2,
+            "total": self.total,
+            "na_count": self.na_count,
+            "count": self.total - self.na_count,
+            "missing_count": self.na_count,
+            "missing_index": list(self.missing_index),
+            "value_counts": value_counts,
+        }
+
+
+def _is_path(source):
+    return isinstance(source, (str, bytes)) or hasattr(source, "__fspath__")
+
+
+class _MemoryReader(io.RawIOBase):
+    # 唯讀、不複製的檔案物件：直接讀 memoryview（例如上傳檔的 getbuffer()），
+    # 背景工作有自己的讀取位置，不會與頁面 rerun 共用上傳檔的 seek 狀態
+    def __init__(self, view):
+        self._view = view.cast("B") if view.format != "B" else view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def _as_stream(source):
+    # memoryview 包成緩衝讀取的檔案物件；路徑與檔案物件原樣傳回
+    if isinstance(source, memoryview):
+        return io.BufferedReader(_MemoryReader(source))
+    return source
+
+
+@contextmanager
+def _open_text(source, encoding):
+    if _is_path(source):
+        with open(source, "r", encoding=encoding, newline="") as f:
+            yield f
+        return
+    source.seek(0)
+    f = io.TextIOWrapper(source, encoding=encoding, newline="")
+    try:
+        yield f
+    finally:
+        f.detach()  # 不要連帶關閉上傳的檔案物件
+
+
+def detect_encoding(source, sample_size=1 << 16):
+    # 只讀檔頭一小段判斷編碼（多位元組字元被截斷的尾端不算失敗）
+    if _is_path(source):
+        with open(source, "rb") as f:
+            sample = f.read(sample_size)
+    else:
+        source.seek(0)
+        sample = source.read(sample_size)
+        source.seek(0)
+    for enc in ENCODINGS:
+        try:
+            sample.decode(enc)
+            return enc
+        except UnicodeDecodeError as e:
+            if e.start >= len(sample) - 4:
+                return enc
+    return None
+
+
+def encoding_candidates(source, encoding=None):
+    # 依序嘗試的編碼：指定的或檔頭樣本判斷的放第一個，其餘 ENCODINGS 依序備用。
+    # 樣本只有 64 KB，前段全是 ASCII、big5 字元在後面才出現時第一個會在讀到一半才失敗
+    first = encoding or detect_encoding(_as_stream(source)) or ENCODINGS[0]
+    return [first] + [e for e in ENCODINGS if e != first]
+
+
+def iter_csv_chunks(source, chunksize=DEFAULT_CHUNKSIZE, encoding=None, categorical_cols=(), clean=True):
+    # 逐塊讀取並套用與 App 相同的清理：去除全空列、欄名去空白、移除 Unnamed 欄位
+    # clean=False：保留原始列與欄位（Tab 2 的轉換不做清理，與一次讀入 read_csv 的結果相同）
+    # source：路徑、檔案物件，或唯讀的 memoryview（上傳檔不必先複製一份）
+    # 浮點數以 round_trip 解析，與 loaders.read_csv（pyarrow 引擎）讀出的值相同
+    source = _as_stream(source)
+    encoding = encoding or detect_encoding(source) or "utf-8"
+    with _open_text(source, encoding) as f:
+        header = pd.read_csv(f, nrows=0).columns
+    raw_names = {str(name).strip(): name for name in header}
+    dtype = {raw_names[str(col).strip()]: str for col in categorical_cols if str(col).strip() in raw_names}
+
+    with _open_text(source, encoding) as f:
+        for chunk in pd.read_csv(f, chunksize=chunksize, dtype=dtype, float_precision="round_trip"):
+            if not clean:
+                yield chunk
+                continue
+            chunk = chunk.dropna(how="all")
+            chunk.columns = chunk.columns.str.strip()
+            chunk = chunk.loc[:, ~chunk.columns.str.contains("^Unnamed")]
+            yield chunk
+
+
+def compute_streaming_stats(source, column_types, chunksize=DEFAULT_CHUNKSIZE, encoding=None, progress=None):
+    # 讀到一半遇到無法解碼的位元組時，捨棄已累計的結果改用下一個編碼從頭讀（與 loaders.read_csv 相同）
+    for enc in encoding_candidates(source, encoding):
+        try:
+            return _streaming_stats(source, column_types, chunksize, enc, progress)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"{getattr(source, 'name', 'CSV')}: 無法以 {', '.join(ENCODINGS)} 讀取")
+
+
+def _streaming_stats(source, column_types, chunksize, encoding, progress):
+    categorical_cols = [col for col, t in column_types.items() if t == 2]
+    aggregates = {}
+    rows = 0
+    for chunk in iter_csv_chunks(source, chunksize, encoding, categorical_cols):
+        if progress is not None:  # 讀取階段尚未處理任何變數，只回報已讀列數（也讓取消能及早生效）
+            progress(0, len(column_types), f"已讀取 {rows:,} 列")
+        rows += len(chunk)
+        for col, type_code in column_types.items():
+            if col not in chunk.columns:
+                continue
+            if col not in aggregates:
+                aggregates[col] = NumericAggregate() if type_code == 1 else CategoricalAggregate()
+            aggregates[col].update(chunk[col])
+
+    stats = {}
+    for col in column_types:
+        if col in aggregates:
+            entry = aggregates[col].to_stats()
+            entry["type"] = column_types[col]
+            stats[col] = entry
+    return stats
+
+
+def generate_codebook_chunked(source, column_types, variable_names, category_definitions,
+                              code_df=None, output_path="codebook.docx", chunksize=DEFAULT_CHUNKSIZE,
+                              encoding=None, fast=False, **kwargs):
+    # 由累計量產出與完整讀入相同章節的 codebook（圖表改由分箱計數與四分位數繪製）
+    stats = compute_streaming_stats(source, column_types, chunksize=chunksize, encoding=encoding,
+                                    progress=kwargs.get("progress"))
+    if fast:
+        from fast import generate_codebook_fast
+        return generate_codebook_fast(None, column_types, variable_names, category_definitions,
+                                      code_df=code_df, output_path=output_path, stats=stats, **kwargs)
+    from test import generate_codebook
+    return generate_codebook(None, column_types, variable_names, category_definitions,
+                             code_df=code_df, output_path=output_path, stats=stats, **kwargs)
@@ -0,0 +1,33 @@
+# 📋 批次建立 Word 表格：一次產生整個 <w:tbl>，再依列、欄順序直接填入文字。
+#    table.cell(i, j) 每次呼叫都會重新展開整個表格的儲存格網格，
+#    上千列的缺失值摘要逐格填寫是 O(n²)；這裡每格只處理一次
+from docx.shared import Emu
+
+
+def _set_text(tc, text):
+    # 與 cell.text 相同：一個段落一個 run，\n 轉成 <w:br/>、\t 轉成 <w:tab/>
+    tc.p_lst[0].add_r().text = str(text)
+
+
+def _merge(tr, start, span):
+    # 與 cell.merge 相同：第一格設定 gridSpan 並加總寬度，其餘格移除
+    tcs = tr.tc_lst[start:start + span]
+    first = tcs[0]
+    first.width = Emu(sum(tc.width for tc in tcs))
+    first.grid_span = span
+    for tc in tcs[1:]:
+        tr.remove(tc)
+
+
+def add_table(doc, rows, style="Table Grid", spans=None):
+    # rows：二維字串陣列；spans：{(列, 起始欄): 合併格數}，該列只需提供合併後剩下的格
+    cols = max(len(row) + sum(span - 1 for (i, _), span in (spans or {}).items() if i == r)
+               for r, row in enumerate(rows))
+    table = doc.add_table(rows=len(rows), cols=cols)
+    table.style = style
+    for (i, j), span in (spans or {}).items():
+        _merge(table._tbl.tr_lst[i], j, span)
+    for tr, row in zip(table._tbl.tr_lst, rows):
+        for tc, text in zip(tr.tc_lst, row):
+            _set_text(tc, text)
+    return table
@@ -1,79 +1,329 @@
-from docx import Document
-from docx.shared import Inches
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from io import BytesIO
 import pandas as pd
-import tempfile
 import os
+from functools import lru_cache
+from stats import compute_column_stats, missing_summary, stratified_sample, PREVIEW_SAMPLE_SIZE
+from imaging import save_figure, draw_histogram, draw_kde
+from cache import lookup_columns, strip_values
+from metadata import build_metadata_index, lookup_description
+from renderers import RendererGroup, output_formats
+from incremental import codebook_fingerprint, diff_fingerprints, extract_sections, load_fingerprint, save_fingerprint, splice_section
+from shards import plan_shards, bundle_path, open_bundle, INDEX_NAME, DEFAULT_SHARD_SIZE
 from matplotlib.font_manager import FontProperties
+# 字型在第一次繪圖時才載入（只載入一次），匯入此模組不必先讀字型檔
+@lru_cache(maxsize=None)
 def get_chinese_font():
     custom_font_path = "font/NotoSerifTC-VariableFont_wght.ttf"
     if os.path.exists(custom_font_path):
         return FontProperties(fname=custom_font_path)
     return None
 
-ch_font = get_chinese_font()
 
-
-def generate_codebook(df, column_types, variable_names, category_definitions, code_df=None, output_path="codebook.docx", preview_mode=False):
+# 🎨 繪圖：不經過 pyplot 全域狀態，直接用 Agg canvas 輸出 PNG bytes
+#    （序列與平行模式共用同一份程式，確保輸出逐位元組一致）
+def _new_figure():
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _figure_to_png(fig, dpi=None, image_format="png"):
+    fig.tight_layout()
+    return save_figure(fig, dpi=dpi, image_format=image_format)
+
+
+def render_categorical_figures(col, value_counts, dpi=None, image_format="png"):
+    ch_font = get_chinese_font()
+    fig, ax = _new_figure()
+    value_counts.plot(kind="bar", color="cornflowerblue", ax=ax)
+    ax.set_title(f"Count Plot of {col}",fontproperties=ch_font)
+    ax.set_ylabel("Frequency", fontproperties=ch_font)  # ✅ Y 軸標題
+    for label in ax.get_yticklabels():                  # ✅ Y 軸數字字體
+        label.set_fontproperties(ch_font)
+
+    # ➤ 設定 x 軸標籤為字串（避免顯示 1.0, 2.0）
+    ax.set_xticks(range(len(value_counts)))
+    ax.set_xticklabels([
+        str(int(cat)) if isinstance(cat, float) and cat.is_integer() else str(cat)
+        for cat in value_counts.index
+    ],fontproperties=ch_font)
+    ax.set_xlabel(col,fontproperties=ch_font)
+    # ➤ 在每根長條上標出數值（轉為 int 顯示）
+    for i, (_, count) in enumerate(value_counts.items()):
+        ax.text(i, count + 0.5, str(int(count)), ha='center', va='bottom', fontsize=8, fontproperties=ch_font)
+
+    return [_figure_to_png(fig, dpi, image_format)]
+
+
+def render_numeric_figures(col, desc, dpi=None, image_format="png"):
+    ch_font = get_chinese_font()
+    images = []
+
+    q1 = desc['25%']
+    q2 = desc['50%']
+    q3 = desc['75%']
+    minimum = desc['min']
+    maximum = desc['max']
+
+    # ➤ 畫圖（分塊模式沒有原始資料，改用累計的四分位數與鬚線）
+    fig2, ax2 = _new_figure()
+    # 由 stats 預先算好的四分位數、鬚線與離群值繪製，不必把整欄資料交給 boxplot 重算
+    ax2.bxp([desc["box"]], vert=True, patch_artist=True,
+            boxprops=dict(facecolor='lightblue', edgecolor='black'),
+            medianprops=dict(color='red'))
+
+    ax2.set_title(f"Boxplot of {col}",fontproperties=ch_font)
+    for label in ax2.get_yticklabels():
+        label.set_fontproperties(ch_font)
+
+    ax2.set_xticks([1])
+    ax2.set_xticklabels([col],fontproperties=ch_font)
+    ax2.set_ylabel("Value",fontproperties=ch_font)
+    # ➤ 加上數值註解
+    def annotate(y, label):
+        ax2.text(1.1, y, f"{label}: {y:.2f}", va="center", fontsize=8, fontproperties=ch_font)
+
+    annotate(minimum, "Min")
+    annotate(q1, "Q1")
+    annotate(q2, "Median")
+    annotate(q3, "Q3")
+    annotate(maximum, "Max")
+    images.append(_figure_to_png(fig2, dpi, image_format))
+
+    # ➤ 畫 histogram
+    fig3, ax3 = _new_figure()
+    # 分箱計數由 stats 預先算好（整數型每個整數一格，否則 'auto'），這裡只畫長條
+    counts, edges = desc["hist"]
+    draw_histogram(ax3, counts, edges)
+    ax3.set_title(f"Histogram of {col}",fontproperties=ch_font)
+    ax3.set_xlabel(col,fontproperties=ch_font)
+    for label in ax3.get_xticklabels():
+        label.set_fontproperties(ch_font)
+    ax3.set_ylabel("Frequency",fontproperties=ch_font)
+    for label in ax3.get_yticklabels():
+        label.set_fontproperties(ch_font)
+    images.append(_figure_to_png(fig3, dpi, image_format))
+
+    # ➤ 畫 KDE（stats 以分箱 FFT 預先算好曲線；分塊模式沒有 KDE）
+    if "kde" in desc:
+        fig4, ax4 = _new_figure()
+        if desc["kde"] is not None:  # 變異數為 0 時不畫曲線
+            draw_kde(ax4, *desc["kde"])
+
+        ax4.set_title(f"KDE Plot of {col}", fontproperties=ch_font)
+        ax4.set_xlabel(col, fontproperties=ch_font)
+        for label in ax4.get_xticklabels():
+            label.set_fontproperties(ch_font)
+        ax4.set_ylabel("Density", fontproperties=ch_font)
+        for label in ax4.get_yticklabels():
+            label.set_fontproperties(ch_font)
+        images.append(_figure_to_png(fig4, dpi, image_format))
+
+    return images
+
+
+def _render_job(job):
+    kind, col, payload, image_options = job
+    if kind == "categorical":
+        return render_categorical_figures(col, payload, **image_options)
+    return render_numeric_figures(col, *payload, **image_options)
+
+
+def _init_render_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _iter_jobs(func, jobs, workers=None):
+    # ⚙️ workers > 1 時以 process pool 平行執行；依 jobs 順序逐一產出結果，呼叫端可邊收邊寫出
+    if workers and workers > 1 and len(jobs) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_render_worker)
+        try:
+            yield from pool.map(func, jobs)
+        finally:
+            pool.shutdown(cancel_futures=True)  # 中途取消時不再等待尚未開始的工作
+        return
+    for job in jobs:
+        yield func(job)
+
+
+def render_figures(jobs, workers=None, progress=None):
+    # progress(n)：每完成一個工作呼叫一次（n 為已完成數）
+    results = []
+    with closing(_iter_jobs(_render_job, jobs, workers)) as figures:
+        for images in figures:
+            results.append(images)
+            if progress is not None:
+                progress(len(results))
+    return results
+
+
+def _add_categorical_section(doc, section, images):
+    col = section["col"]
+    var_name = section["var_name"]
+    value_counts = section["value_counts"]
+    total = section["total"]
+    missing_index = section["missing_index"]
+    description = section["description"]
+    defs = section["defs"]
+    lines = [
+        f"{int(k) if isinstance(k, float) and k.is_integer() else k}: {defs.get(k, '')} → {v} ({v/total:.2%})"
+        for k, v in value_counts.items()
+    ]
+    summary_text = "\n".join(lines)
+
+    if missing_index:
+        preview = ", ".join(map(str, missing_index[:5]))
+        suffix = " ..." if len(missing_index) > 5 else ""
+        missing_text = preview + suffix
+    else:
+        missing_text = "None"
+
+    doc.table([
+        ["Variable Name", f"{col} ({var_name})"],
+        ["Categories Summary", summary_text],
+        ["Valid count", section["valid_count"]],
+        ["NoV count", section["missing_count"]],
+        ["NoV index", missing_text],
+        ["Description", description if description else "No description available"],
+    ])
+
+    if section.get("preview"):
+        doc.paragraph("🔎 Preview mode: category counts and missing values are exact (all rows).")
+
+    for png in images:
+        doc.image(png, 4.5)
+
+
+def _sample_note(desc):
+    sample = desc["sample"]
+    intervals = "; ".join(
+        f"{label} ∈ [{lo:.3f}, {hi:.3f}]"
+        for label, (lo, hi) in zip(["Q1", "Q2", "Q3"], sample["intervals"].values())
+    )
+    return (
+        f"🔎 Preview mode: Q1/Q2/Q3, boxplot, histogram and KDE are estimated from a stratified sample of "
+        f"{sample['size']:,} of {sample['population']:,} valid values (seed {sample['seed']}); "
+        f"mean, std, min, max and counts are exact. "
+        f"{sample['confidence']:.0%} bound (DKW): sample CDF within ±{sample['epsilon']:.2%} of the full data; "
+        f"{intervals}."
+    )
+
+
+def _add_numeric_section(doc, section, images):
+    col = section["col"]
+    var_name = section["var_name"]
+    desc = section["desc"]
+    missing_index = section["missing_index"]
+    description = section["description"]
+
+    if missing_index:
+        preview = ", ".join(map(str, missing_index[:5]))
+        suffix = " ..." if len(missing_index) > 5 else ""
+        missing_text = preview + suffix
+    else:
+        missing_text = "None"
+
+    doc.table([
+        ["Index", var_name, "Variable Name", col],
+        ["Mean", f"{desc['mean']:.3f}", "Std Dev", f"{desc['std']:.3f}"],
+        ["Max", f"{desc['max']:.3f}", "Min", f"{desc['min']:.3f}"],
+        ["Q1 (25%)", f"{desc['25%']:.3f}", "Q2 (50%)", f"{desc['50%']:.3f}"],
+        ["Q3 (75%)", f"{desc['75%']:.3f}", "Range", f"{desc['max'] - desc['min']:.3f}"],
+        ["Valid N", section["valid_count"], "Missing Count", section["missing_count"]],
+        [" ", " ", "Missing Index", missing_text],
+        ["Description", description if description else "No description available"],
+    ], spans={(7, 1): 3})  # Description 合併第 2–4 欄
+
+    if "sample" in desc:
+        doc.paragraph(_sample_note(desc))
+
+    for png in images:
+        doc.image(png, 4.5)
+
+
+def _add_sections(doc, sections, reused=None, old_doc=None):
+    for section in sections:
+        col = section["col"]
+        doc.heading(f"Variable: {col} ({section['var_name']})", 2)
+        if reused and col in reused:
+            splice_section(doc.get("docx").doc, old_doc, reused[col])
+            continue
+        if section.get("skip"):
+            continue
+        if section["type_code"] == 2:
+            _add_categorical_section(doc, section, section["images"])
+        elif section["type_code"] == 1:
+            _add_numeric_section(doc, section, section["images"])
+
+
+def _build_shard(shard):
+    # 在 worker 中繪製並寫出一份分割文件；回傳 (docx 位元組, 本次新畫的圖檔)，文件物件不離開 worker。
+    # 圖檔只在需要寫入快取時回傳（keep_images），否則主行程只收 docx 位元組
+    title, sections, keep_images = shard
+    doc = RendererGroup("docx")
+    doc.heading(title, 1)
+    rendered = {}
+    for section in sections:
+        if section["job"] is not None:
+            section["images"] = rendered[section["col"]] = _render_job(section["job"])
+    _add_sections(doc, sections)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue(), rendered if keep_images else {}
+
+
+def _add_shard_index(doc, shards):
+    doc.heading("Shards", 2)
+    doc.table([["Part", "File", "Variables"]] + [
+        [shard["label"], shard["file_name"], len(shard["sections"])] for shard in shards
+    ])
+    doc.heading("Variable Index", 2)
+    doc.table([["Index", "Variable", "File"]] + [
+        [section["var_name"], section["col"], shard["file_name"]] for shard in shards for section in shard["sections"]
+    ])
+
+
+def generate_codebook(df, column_types, variable_names, category_definitions, code_df=None, output_path="codebook.docx", preview_mode=False, workers=None, stats=None, dpi=None, image_format="png", cache=None, previous_report=None, previous_fingerprint=None, fingerprint_path=None, progress=None, sample_size=None, sample_seed=0, shard_by=None, shard_size=DEFAULT_SHARD_SIZE, column_roles=None, output_format="docx"):
+    # preview_mode=True：計數與缺失值維持精確，分位數與圖改由可重現的分層抽樣（sample_size 列）估計
+    # shard_by="count"／"role"／"type"：變數分成多份文件（每份最多 shard_size 個），與 index.docx 一起打包成 zip
+    # output_format："docx"／"html"／"md" 或其清單：同一次統計與繪圖同時寫出多種格式（見 renderers.py）
     if output_path is None:
         output_path = "codebook.docx"
+    if shard_by is not None and previous_report is not None:
+        raise ValueError("更新模式（previous_report）不支援分割輸出")
+    if output_formats(output_format) != ["docx"] and (shard_by is not None or previous_report is not None):
+        raise ValueError("分割輸出與更新模式只支援 docx 格式")
+
+    sample = None
+    if preview_mode and df is not None:
+        sample = stratified_sample(len(df), sample_size or PREVIEW_SAMPLE_SIZE, sample_seed)
+    preview_options = () if sample is None else ("preview", len(sample), sample_seed)
 
     if code_df is not None:
         code_df.columns = code_df.columns.str.strip().str.lower()
 
-    doc = Document()
-    doc.add_heading("Codebook Summary Report", level=1)
-
-    # ✅ 只統計實際存在欄位的缺失值
-    valid_cols = [col for col in column_types.keys() if col in df.columns]
-    
-    na_counts = df[valid_cols].isnull().sum()
-    na_percent = df[valid_cols].isnull().mean() * 100
-
-    doc.add_heading("Missing Value Summary", level=2)
-    na_df = pd.DataFrame({
-        "column": na_counts.index,
-        "missing_count": na_counts.values,
-        "missing_rate (%)": na_percent.round(2).values
-    }).query("`missing_count` > 0").reset_index(drop=True)
-
-    if not na_df.empty:
-        table = doc.add_table(rows=1 + len(na_df), cols=4)
-        table.style = "Table Grid"
-        table.cell(0, 0).text = "Index"
-        table.cell(0, 1).text = "Variable"
-        table.cell(0, 2).text = "Missing Count"
-        table.cell(0, 3).text = "Missing Rate (%)"
-        for i, row in na_df.iterrows():
-            col_name = row["column"]
-            index_label = variable_names.get(col_name, col_name)
-            table.cell(i + 1, 0).text = index_label
-            table.cell(i + 1, 1).text = str(row["column"])
-            table.cell(i + 1, 2).text = str(row["missing_count"])
-            table.cell(i + 1, 3).text = str(row["missing_rate (%)"])
-    else:
-        doc.add_paragraph("No missing values in any columns.")
-
-    # 🔹 變數類型統計區塊
-    doc.add_heading("Variable Type Summary", level=2)
-    type_count = pd.Series(column_types).value_counts().sort_index()
-    type_label_map = {1: "數值型 (Numerical)", 2: "類別型 (Categorical)"}
-
-    table = doc.add_table(rows=1 + len(type_count), cols=2)
-    table.style = "Table Grid"
-    table.cell(0, 0).text = "變數類型"
-    table.cell(0, 1).text = "欄位數"
-    for i, (type_code, count) in enumerate(type_count.items()):
-        label = type_label_map.get(type_code, f"其他 ({type_code})")
-        table.cell(i + 1, 0).text = label
-        table.cell(i + 1, 1).text = str(count)
+    doc = RendererGroup(output_format)
+    doc.heading("Codebook Summary Report" + (" (Preview)" if sample is not None else ""), 1)
+    if sample is not None:
+        doc.paragraph(
+            f"🔎 Preview report: numeric quantiles and figures are estimated from a stratified sample of "
+            f"{len(sample):,} of {len(df):,} rows (seed {sample_seed}). Generate the report without preview mode for exact values."
+        )
 
-    # 🔹 欄位細節處理
-    columns = code_df["variable"] if code_df is not None and "variable" in code_df.columns else df.columns
+    # 🔹 依 codebook 順序整理要輸出的變數與其 metadata
+    available = stats if stats is not None else {col: None for col in column_types if col in df.columns}
+    columns = code_df["variable"] if code_df is not None and "variable" in code_df.columns else list(available)
+    metadata = build_metadata_index(code_df)
+    sections = []
 
     for col in columns:
         col = str(col).strip()
-        if col not in column_types or col not in df.columns:
+        if col not in available:
             continue
 
         type_code = column_types[col]
@@ -81,226 +331,165 @@ def generate_codebook(df, column_types, variable_names, category_definitions, co
             continue
 
         var_name = variable_names.get(col, col)
-        doc.add_heading(f"Variable: {col} ({var_name})", level=2)
+        section = {"col": col, "var_name": var_name, "type_code": type_code, "job": None}
+        sections.append(section)
+
+        # ➕ 加入 Description 段落（由預先建立的索引查詢，不再每個變數掃描一次 code_df）
+        section["description"] = lookup_description(metadata, col)
+        section["defs"] = category_definitions.get(col, {})
+
+    # 🔁 更新模式：資料與 metadata 都沒變的章節直接從前一版報告複製
+    fingerprint, reused, old_doc = None, {}, None
+    if df is not None and (fingerprint_path is not None or previous_report is not None):
+        section_meta = [(s["col"], s["var_name"], s["type_code"], s["description"], s["defs"]) for s in sections]
+        options = {"dpi": dpi, "image_format": image_format}
+        if sample is not None:
+            options["preview"] = preview_options
+        fingerprint = codebook_fingerprint(df, column_types, section_meta, options)
+        if previous_report is not None and previous_fingerprint is not None:
+            previous_fingerprint = load_fingerprint(previous_fingerprint)
+            old_doc, old_sections = extract_sections(previous_report, previous_fingerprint)
+            unchanged = diff_fingerprints(previous_fingerprint, fingerprint)["unchanged"]
+            reused = {col: old_sections[col] for col in unchanged if col in old_sections}
+
+    # ✅ 只統計實際存在欄位的缺失值（所有統計量由 stats 一次掃描算出；分塊模式會直接傳入累計結果）
+    # 🗃️ 有快取時，資料與類型未變的欄位直接沿用上次的統計量與圖檔，只重算其餘欄位
+    cache_keys, cached = {}, {}
+    if stats is None:
+        if cache is not None:
+            cache_keys, cached = lookup_columns(cache, df, column_types, "full", dpi, image_format, *preview_options)
+        pending = {col: t for col, t in column_types.items() if col not in cached and col not in reused}
+        stats = compute_column_stats(df, pending, kde=True, sample=sample, seed=sample_seed)
+        stats.update({col: record["stats"] for col, record in cached.items()})
+        stats.update({col: fingerprint["variables"][col] for col in reused if col not in stats})
+        stats = {col: stats[col] for col in column_types if col in stats}
+    na_rows = missing_summary(stats)
+
+    doc.heading("Missing Value Summary", 2)
+
+    if na_rows:
+        rows = [["Index", "Variable", "Missing Count", "Missing Rate (%)"]]
+        for col_name, missing_count, missing_rate in na_rows:
+            index_label = variable_names.get(col_name, col_name)
+            rows.append([index_label, col_name, missing_count, missing_rate])
+        doc.table(rows)
+    else:
+        doc.paragraph("No missing values in any columns.")
+
+    # 🔹 變數類型統計區塊
+    doc.heading("Variable Type Summary", 2)
+    type_count = pd.Series(column_types).value_counts().sort_index()
+    type_label_map = {1: "數值型 (Numerical)", 2: "類別型 (Categorical)"}
 
-        # ➕ 加入 Description 段落
-        description = None
-        if code_df is not None:
-            desc_col_candidates = ['description', 'desc', '說明']
-            for desc_col in desc_col_candidates:
-                if desc_col in code_df.columns:
-                    row_match = code_df[code_df["variable"] == col]
-                    if not row_match.empty:
-                        description = str(row_match.iloc[0][desc_col])
-                    break
+    rows = [["變數類型", "欄位數"]]
+    for type_code, count in type_count.items():
+        rows.append([type_label_map.get(type_code, f"其他 ({type_code})"), count])
+    doc.table(rows)
 
+    # 🔹 欄位細節處理：先整理每個變數的統計與繪圖工作，再依 codebook 順序寫入文件
+    image_options = {"dpi": dpi, "image_format": image_format}
+
+    for section in sections:
+        col = section["col"]
+        type_code = section["type_code"]
+        if col in reused:
+            continue
+        entry = stats[col]
 
         # 🟦 類別型
         if type_code == 2:
-            value_counts = df[col].value_counts(dropna=False).sort_index()
-            total = len(df)
-            valid_count = df[col].notna().sum()
-            missing_index = df[df[col].isna()].index.tolist()
-            missing_count = df[col].isna().sum()
-            defs = category_definitions.get(col, {})
-            lines = [
-                f"{int(k) if isinstance(k, float) and k.is_integer() else k}: {defs.get(k, '')} → {v} ({v/total:.2%})"
-                for k, v in value_counts.items()
-            ]
-            summary_text = "\n".join(lines)
-
-            table = doc.add_table(rows=6, cols=2)
-            table.style = "Table Grid"
-            table.cell(0, 0).text = "Variable Name"
-            table.cell(0, 1).text = f"{col} ({var_name})"
-            table.cell(1, 0).text = "Categories Summary"
-            table.cell(1, 1).text = summary_text
-            table.cell(2, 0).text = "Valid count"
-            table.cell(2, 1).text = str(valid_count)
-            table.cell(3, 0).text = "NoV count"
-            table.cell(3, 1).text = str(missing_count)
-            table.cell(4, 0).text = "NoV index"
-
-            if missing_index:
-                preview = ", ".join(map(str, missing_index[:5]))
-                suffix = " ..." if len(missing_index) > 5 else ""
-                table.cell(4, 1).text = preview + suffix
-            else:
-                table.cell(4, 1).text = "None"
-            table.cell(5, 0).text = "Description"
-            table.cell(5, 1).text = description if description else "No description available"
-            
-            fig, ax = plt.subplots()
-            value_counts.plot(kind="bar", color="cornflowerblue", ax=ax)
-            ax.set_title(f"Count Plot of {col}",fontproperties=ch_font)
-            ax.set_ylabel("Frequency", fontproperties=ch_font)  # ✅ Y 軸標題
-            for label in ax.get_yticklabels():                  # ✅ Y 軸數字字體
-                label.set_fontproperties(ch_font)
-            
-            # ➤ 設定 x 軸標籤為字串（避免顯示 1.0, 2.0）
-            ax.set_xticks(range(len(value_counts)))
-            ax.set_xticklabels([
-                str(int(cat)) if isinstance(cat, float) and cat.is_integer() else str(cat)
-                for cat in value_counts.index
-            ],fontproperties=ch_font)
-            ax.set_xlabel(col,fontproperties=ch_font)
-            # ➤ 在每根長條上標出數值（轉為 int 顯示）
-            for i, (_, count) in enumerate(value_counts.items()):
-                ax.text(i, count + 0.5, str(int(count)), ha='center', va='bottom', fontsize=8, fontproperties=ch_font)
-
-
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-            plt.tight_layout()
-            plt.savefig(tmp.name)
-            plt.close()
-            doc.add_picture(tmp.name, width=Inches(4.5))
-            try: os.unlink(tmp.name)
-            except PermissionError: pass
+            value_counts = entry["value_counts"].sort_index()
+            section.update(
+                preview=sample is not None,
+                value_counts=value_counts,
+                total=entry["total"],
+                valid_count=entry["count"],
+                missing_index=entry["missing_index"],
+                missing_count=entry["missing_count"],
+            )
+            section["job"] = ("categorical", col, value_counts, image_options)
 
         # 🟩 數值型
         elif type_code == 1:
-            try:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-            except Exception:
-                continue
-            if df[col].dropna().empty:
+            if entry["count"] == 0:
+                section["skip"] = True
                 continue
-            data = df[col].dropna()
-            desc = data.describe()
-            valid_count = len(data)
-            missing_index = df[df[col].isna()].index.tolist()
-            missing_count = len(missing_index)
-            table = doc.add_table(rows=8, cols=4)
-            table.style = "Table Grid"
-            table.cell(0, 0).text = "Index"
-            table.cell(0, 1).text = var_name
-            table.cell(0, 2).text = "Variable Name"
-            table.cell(0, 3).text = col
-
-            table.cell(1, 0).text = "Mean"
-            table.cell(1, 1).text = f"{desc['mean']:.3f}"
-            table.cell(1, 2).text = "Std Dev"
-            table.cell(1, 3).text = f"{desc['std']:.3f}"
-
-            table.cell(2, 0).text = "Max"
-            table.cell(2, 1).text = f"{desc['max']:.3f}"
-            table.cell(2, 2).text = "Min"
-            table.cell(2, 3).text = f"{desc['min']:.3f}"
-
-            table.cell(3, 0).text = "Q1 (25%)"
-            table.cell(3, 1).text = f"{desc['25%']:.3f}"
-            table.cell(3, 2).text = "Q2 (50%)"
-            table.cell(3, 3).text = f"{desc['50%']:.3f}"
-
-            table.cell(4, 0).text = "Q3 (75%)"
-            table.cell(4, 1).text = f"{desc['75%']:.3f}"
-            table.cell(4, 2).text = "Range"
-            table.cell(4, 3).text = f"{desc['max'] - desc['min']:.3f}"
-            
-            table.cell(5, 0).text = "Valid N"
-            table.cell(5, 1).text = str(valid_count)
-            table.cell(5, 2).text = "Missing Count"
-            table.cell(5, 3).text = str(missing_count)
-
-            table.cell(6, 0).text = " "
-            table.cell(6, 1).text = " "
-            table.cell(6, 2).text = "Missing Index"
-            if missing_index:
-                preview = ", ".join(map(str, missing_index[:5]))
-                suffix = " ..." if len(missing_index) > 5 else ""
-                table.cell(6, 3).text = preview + suffix
-            else:
-                table.cell(6, 3).text = "None"
-
-            table.cell(7, 0).text = "Description"
-            table.cell(7, 1).merge(table.cell(7, 3))  # 合併單元格
-            table.cell(7, 1).text = description if description else "No description available"
-
-            q1 = desc['25%']
-            q2 = desc['50%']
-            q3 = desc['75%']
-            minimum = desc['min']
-            maximum = desc['max']
-
-            # ➤ 畫圖
-            fig2, ax2 = plt.subplots()
-            box = ax2.boxplot([data], vert=True, patch_artist=True,
-                            boxprops=dict(facecolor='lightblue', color='black'),
-                            medianprops=dict(color='red'))
-
-            ax2.set_title(f"Boxplot of {col}",fontproperties=ch_font)
-            for label in ax2.get_yticklabels():
-                label.set_fontproperties(ch_font)
-
-            ax2.set_xticks([1])
-            ax2.set_xticklabels([col],fontproperties=ch_font)
-            ax2.set_ylabel("Value",fontproperties=ch_font)
-            # ➤ 加上數值註解
-            def annotate(y, label):
-                ax2.text(1.1, y, f"{label}: {y:.2f}", va="center", fontsize=8, fontproperties=ch_font)
-
-            annotate(minimum, "Min")
-            annotate(q1, "Q1")
-            annotate(q2, "Median")
-            annotate(q3, "Q3")
-            annotate(maximum, "Max")
-
-            tmp2 = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-            plt.tight_layout()
-            plt.savefig(tmp2.name)
-            plt.close()
-            doc.add_picture(tmp2.name, width=Inches(4.5))
-            try: os.unlink(tmp2.name)
-            except PermissionError: pass
-
-            # ➤ 畫 histogram
-            import numpy as np
-            fig3, ax3 = plt.subplots()
-            # 判斷是否為整數型資料（全部或幾乎都是整數）
-            if np.allclose(data, data.astype(int)):
-                # 每個整數獨立一個 bin
-                bins = np.arange(data.min(), data.max() + 2) - 0.5
-            else:
-                # 使用自動分箱（適合連續型數據）
-                bins = 'auto'
-            ax3.hist(data, bins=bins, color='lightblue', edgecolor='black')
-            ax3.set_title(f"Histogram of {col}",fontproperties=ch_font)
-            ax3.set_xlabel(col,fontproperties=ch_font)
-            for label in ax3.get_xticklabels():
-                label.set_fontproperties(ch_font)
-            ax3.set_ylabel("Frequency",fontproperties=ch_font)
-            for label in ax3.get_yticklabels():
-                label.set_fontproperties(ch_font)
-
-            tmp3 = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-            plt.tight_layout()
-            plt.savefig(tmp3.name)
-            plt.close()
-            doc.add_picture(tmp3.name, width=Inches(4.5))
-            try: os.unlink(tmp3.name)
-            except PermissionError: pass
-
-                        # ➤ 畫 KDE
-            if len(data) > 1:
-                import seaborn as sns
-                fig4, ax4 = plt.subplots()
-                sns.kdeplot(data, ax=ax4, color="blue", linewidth=1.5, fill=True, alpha=0.3)
-
-                ax4.set_title(f"KDE Plot of {col}", fontproperties=ch_font)
-                ax4.set_xlabel(col, fontproperties=ch_font)
-                for label in ax4.get_xticklabels():
-                    label.set_fontproperties(ch_font)
-                ax4.set_ylabel("Density", fontproperties=ch_font)
-                for label in ax4.get_yticklabels():
-                    label.set_fontproperties(ch_font)
-
-                tmp4 = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-                plt.tight_layout()
-                plt.savefig(tmp4.name)
-                plt.close()
-                doc.add_picture(tmp4.name, width=Inches(4.5))
-                try: os.unlink(tmp4.name)
-                except PermissionError: pass
-
-    doc.save(output_path)
+            desc = entry
+            section.update(
+                desc=desc,
+                valid_count=entry["count"],
+                missing_index=entry["missing_index"],
+                missing_count=entry["missing_count"],
+            )
+            section["job"] = ("numeric", col, (desc,), image_options)
+
+        if col in cached:
+            section["job"] = None
+            section["images"] = cached[col]["images"]
+
+    if shard_by is not None:
+        return _write_shards(doc, sections, stats, cache, cache_keys, cached, fingerprint, fingerprint_path,
+                             output_path, sample is not None, workers, progress, shard_by, shard_size, column_roles)
+
+    pending_sections = [section for section in sections if section["job"] is not None]
+
+    # ⏳ progress(done, total, 變數名稱)：快取命中或沿用的章節直接算完成，其餘每畫完一個變數回報一次
+    def report(n):
+        if progress is not None:
+            done = len(sections) - len(pending_sections) + n
+            progress(done, len(sections), pending_sections[n - 1]["col"] if n else "")
+
+    report(0)
+    figures = render_figures([section["job"] for section in pending_sections], workers=workers, progress=report)
+    for section, images in zip(pending_sections, figures):
+        section["images"] = images
+
+    for section in sections:
+        col = section["col"]
+        if col in cache_keys and col not in cached and col not in reused:
+            cache.put(cache_keys[col], {"stats": strip_values(stats[col]), "images": section.get("images", [])})
+    _add_sections(doc, sections, reused, old_doc)
+
+    output_path = doc.save(output_path)
+    if fingerprint is not None and fingerprint_path is not None:
+        save_fingerprint(fingerprint, fingerprint_path)
+    return output_path
+
+
+def _write_shards(doc, sections, stats, cache, cache_keys, cached, fingerprint, fingerprint_path,
+                  output_path, preview, workers, progress, shard_by, shard_size, column_roles):
+    # 🧩 doc 已有摘要表，改作索引文件；各份文件在 worker 中繪圖、建立與存檔，
+    #    完成一份就寫進 zip 並釋放，主行程同時只持有一份文件的位元組
+    shards = plan_shards(sections, shard_by, shard_size, column_roles)
+    _add_shard_index(doc, shards)
+    title = "Codebook Summary Report" + (" (Preview)" if preview else "")
+    tasks = [(f"{title} — {shard['label']}", shard["sections"], bool(cache_keys)) for shard in shards]
+
+    # ⏳ progress(done, total, 分割名稱)：每完成一份文件回報一次
+    finished = [0]
+    for shard in shards:
+        finished.append(finished[-1] + len(shard["sections"]))
+
+    def report(n):
+        if progress is not None:
+            progress(finished[n], len(sections), shards[n - 1]["label"] if n else "")
+
+    report(0)
+    output_path = bundle_path(output_path)
+    with open_bundle(output_path) as bundle:
+        index = BytesIO()
+        doc.save(index)
+        bundle.writestr(INDEX_NAME, index.getvalue())
+        del index
+        with closing(_iter_jobs(_build_shard, tasks, workers)) as results:
+            for n, (shard, (content, images)) in enumerate(zip(shards, results), 1):
+                bundle.writestr(shard["file_name"], content)
+                del content
+                for section in shard["sections"]:
+                    col = section["col"]
+                    if col in cache_keys and col not in cached:
+                        cache.put(cache_keys[col], {"stats": strip_values(stats[col]), "images": images.get(col, [])})
+                report(n)
+    if fingerprint is not None and fingerprint_path is not None:
+        save_fingerprint(fingerprint, fingerprint_path)
     return output_path
@@ -0,0 +1,366 @@
+import argparse
+import json
+import sys
+import numpy as np
+import pandas as pd
+from pandas._libs.sparse import IntIndex
+
+# 🔧 進階分析工具（Tab 2）的 Transform 引擎：先把 code.csv 的 Transform 欄位編譯成轉換計畫，
+#    再一次算出所有新欄位、最後只組裝一次輸出表格（不再每個變數 drop／concat 整份資料）。
+#    TransformPipeline 在參考資料上學到分位數切點與 one-hot 類別後可存成 JSON，
+#    之後逐塊套用到新資料（例如每日增量），輸出欄位固定、記憶體用量不隨檔案大小成長
+PIPELINE_VERSION = 1
+DEFAULT_CHUNKSIZE = 100_000
+# 🧮 one-hot 欄位一律為 uint8；類別數超過此值時改用 sparse 欄位（只記錄 1 的位置），
+#    例如 5,000 種郵遞區號 × 2M 列不會展開成數十 GB 的稠密矩陣
+SPARSE_MIN_LEVELS = 16
+SPARSE_DTYPE = pd.SparseDtype(np.uint8, 0)
+# 匯出 CSV 時每段最多轉成稠密格式的儲存格數（列數 × 欄數）
+EXPORT_CELLS = 1 << 22
+NO_TRANSFORM = ["", "nan", "none"]
+TYPE_MAP = {
+    "1": 'Numerical', "numerical": 'Numerical', "連續": 1, "數值": 'Numerical',
+    "2": 'Categorical', "categorical": 'Categorical', "類別": 'Categorical'
+}
+FAILURE_MESSAGES = {
+    "bins": "分箱失敗",
+    "quantile": "分位數切分失敗",
+    "cuts": "自訂切分失敗",
+    "onehot": "one-hot 編碼失敗",
+    "threshold": "單一數字分界失敗",
+}
+
+
+def _numbers(text):
+    return [float(x.strip()) for x in text.split(",") if x.strip()]
+
+
+def _parse(transform):
+    # 回傳 (kind, 參數)；解析失敗時參數為 Exception，套用時再以對應的訊息提示
+    lower = transform.lower()
+    try:
+        if lower in NO_TRANSFORM:
+            return "keep", None
+        if lower.startswith("cut:["):  # cut:[0,100,200] → 手動分箱（只解析數字，可寫 inf，不再用 eval 執行字串）
+            body = transform[4:].strip()
+            if not body.endswith("]"):
+                raise ValueError(f"切點需以 [ ] 括住：{transform}")
+            return "bins", _numbers(body[1:-1])
+        if lower.startswith("cut:"):  # cut:k → 分位數切分
+            return "quantile", int(transform.split(":")[1])
+        if "," in transform:  # 24,30 → 自訂切分點
+            cuts = _numbers(transform)
+            return "cuts", [-float("inf")] + cuts + [float("inf")]
+        if lower == "onehot":
+            return "onehot", None
+        if lower.startswith("onehot:"):  # onehot:k → 只保留最常見的 k 類，其餘歸入 <變數>_other
+            return "onehot", int(transform.split(":")[1])
+        if transform.replace(".", "", 1).isdigit():  # 單一數字 → 切兩類
+            return "threshold", float(transform)
+        return "unknown", None
+    except Exception as e:
+        # 依實際的寫法決定提示訊息（onehot:abc 不應顯示自訂切分失敗）
+        if lower.startswith("cut:["):
+            kind = "bins"
+        elif lower.startswith("cut:"):
+            kind = "quantile"
+        elif lower.startswith("onehot:"):
+            kind = "onehot"
+        else:
+            kind = "cuts"
+        return kind, e
+
+
+def compile_plan(code_df):
+    # code_df 欄名需已轉小寫；每列一個步驟，依 code.csv 順序執行
+    plan = []
+    for row in code_df.to_dict("records"):
+        transform = str(row.get("transform", "")).strip()
+        kind, param = _parse(transform)
+        plan.append({
+            "variable": str(row.get("variable", "")).strip(),
+            "kind": kind,
+            "param": param,
+            "transform": transform,
+            "type": str(row.get("type", "1")).strip().lower(),
+            "description": row.get("description"),
+        })
+    return plan
+
+
+def _is_text(series):
+    # 文字欄位沒有可用的 Transform 時一律 one-hot（pandas 3 的字串欄位 dtype 為 str 而非 object）
+    return series.dtype == "object" or isinstance(series.dtype, pd.StringDtype)
+
+
+def _onehot(series, step):
+    # 每列的類別代碼只算一次；缺失值全為 0，有 other 欄時不在保留類別內（或參考資料沒見過）的值歸入 other
+    names = step["columns"]
+    codes = pd.Categorical(series, categories=step["values"]).codes.astype(np.int64)
+    if step.get("other") is not None:
+        codes[(codes < 0) & series.notna().to_numpy()] = len(step["values"])
+    if len(names) <= SPARSE_MIN_LEVELS:
+        return {name: pd.Series((codes == i).astype(np.uint8), index=series.index) for i, name in enumerate(names)}
+    # 類別多時依代碼排序一次，每個類別直接取得 1 的位置，不必對每個類別掃描整欄
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    return {
+        name: pd.Series(pd.arrays.SparseArray(
+            np.ones(bounds[i + 1] - bounds[i], dtype=np.uint8),
+            sparse_index=IntIndex(len(codes), order[bounds[i]:bounds[i + 1]]), dtype=SPARSE_DTYPE,
+        ), index=series.index)
+        for i, name in enumerate(names)
+    }
+
+
+def _apply_step(series, step):
+    # 套用已學好參數的步驟；onehot 回傳 {新欄位: Series}，其他回傳單一 Series
+    kind = step["kind"]
+    if kind == "onehot":
+        return _onehot(series, step)
+    if kind == "threshold":  # 左閉右開，<cut_point → 0、>=cut_point → 1
+        return (series >= step["threshold"]).astype(int)
+    # 分箱代碼固定為 Int64：有缺失值的區塊不會變成 2.0，逐塊匯出時同一欄的寫法一致
+    return pd.cut(series, bins=step["edges"], include_lowest=step["include_lowest"], labels=False).astype("Int64")
+
+
+def _fit_step(series, col, kind, param):
+    # 回傳 (可序列化的步驟, 參考資料上的轉換結果)
+    if isinstance(param, Exception):
+        raise param
+    if kind == "onehot":  # 類別與欄名與 pd.get_dummies(prefix=col) 相同，新資料中沒見過的值全為 0
+        values = pd.Categorical(series).categories.tolist()
+        step = {"variable": col, "kind": kind, "values": values, "columns": [f"{col}_{v}" for v in values], "other": None}
+        if param is not None and len(values) > param:
+            top = set(series.value_counts().index[:param].tolist())
+            step["values"] = [v for v in values if v in top]
+            step["columns"] = [f"{col}_{v}" for v in step["values"]]
+            other = f"{col}_other"
+            while other in step["columns"]:
+                other += "_"
+            step["other"] = other
+            step["columns"].append(other)
+        return step, _apply_step(series, step)
+    if kind == "quantile":
+        # 切點以參考資料的分位數為準；頭尾改成 ±inf，新資料超出參考範圍的值歸入最外側的組
+        binned, edges = pd.qcut(series, q=param, labels=False, retbins=True, duplicates="drop")
+        edges = [-float("inf")] + edges[1:-1].tolist() + [float("inf")] if len(edges) > 1 else edges.tolist()
+        return {"variable": col, "kind": kind, "edges": edges, "include_lowest": True,
+                "output": col + "_binned"}, binned.astype("Int64")
+    if kind == "threshold":
+        step = {"variable": col, "kind": kind, "threshold": param, "output": col + "_binned"}
+    else:  # bins（手動分箱，含最小值）與 cuts（自訂切分點）
+        step = {"variable": col, "kind": kind, "edges": param, "include_lowest": kind == "bins",
+                "output": col + "_binned"}
+    return step, _apply_step(series, step)
+
+
+class TransformPipeline:
+    def __init__(self, plan=None):
+        self.plan = plan or []
+        self.steps = []  # 學好參數的步驟（失敗或略過的變數不會出現）
+        self.columns = []  # 輸出欄位順序
+        self.inputs = []  # 套用時需要的輸入欄位
+        self.code = []  # 新的 code 表
+        self.variable_names = {}  # 新欄位 → 原欄位
+        self.warnings = []
+
+    def _fit(self, df):
+        # 輸出欄位順序與逐欄 drop／concat 的結果相同：未轉換的欄位維持原位置，新欄位依序加在最後
+        columns = {col: df[col] for col in df.columns}
+        self.steps, self.code, self.variable_names, self.warnings = [], [], {}, []
+
+        for planned in self.plan:
+            col, kind, transform = planned["variable"], planned["kind"], planned["transform"]
+            if not col or col not in columns or col not in df.columns:
+                continue
+            series = df[col]
+            record = {"Description": planned["description"]}
+
+            if kind == "keep":
+                self.code.append({"Variable": col, "Type": TYPE_MAP.get(planned["type"], 1), **record, "Transform": ""})
+                continue
+            if kind in ("threshold", "unknown") and _is_text(series):
+                kind = "onehot"
+            if kind == "unknown":
+                self.warnings.append(f"🔸 未知 Transform 指令：{transform}（欄位 {col}）")
+                continue
+
+            try:
+                step, result = _fit_step(series, col, kind, planned["param"])
+            except Exception as e:
+                self.warnings.append(f"🔸 {col} {FAILURE_MESSAGES[kind]}：{e}")
+                continue
+            self.steps.append(step)
+            outputs = result if kind == "onehot" else {step["output"]: result}
+            columns.update(outputs)
+            del columns[col]
+            for new_col in outputs:
+                self.variable_names[new_col] = col
+                top_k = planned["kind"] == "onehot" and planned["param"] is not None
+                self.code.append({"Variable": new_col, "Type": "Categorical", **record,
+                                  "Transform": "onehot" if kind == "onehot" and not top_k else transform})
+
+        self.columns = list(columns)
+        produced = set(self.variable_names)
+        self.inputs = list(dict.fromkeys(
+            [col for col in self.columns if col not in produced] + [step["variable"] for step in self.steps]))
+        return pd.concat(columns, axis=1) if columns else df.iloc[:, :0]
+
+    def fit(self, df):
+        self._fit(df)
+        return self
+
+    def fit_transform(self, df):
+        return self._fit(df)
+
+    def transform(self, df):
+        missing = [col for col in self.inputs if col not in df.columns]
+        if missing:
+            raise ValueError(f"資料缺少欄位：{', '.join(missing)}")
+        columns = {}
+        for step in self.steps:
+            result = _apply_step(df[step["variable"]], step)
+            columns.update(result if step["kind"] == "onehot" else {step["output"]: result})
+        if not self.columns:
+            return df.iloc[:, :0]
+        return pd.concat({col: columns[col] if col in columns else df[col] for col in self.columns}, axis=1)
+
+    def transform_csv(self, source, output, chunksize=DEFAULT_CHUNKSIZE, encoding=None, progress=None):
+        # 逐塊讀取 CSV 套用轉換後附加寫出，一次只有一塊在記憶體中；回傳寫出的列數。
+        # 與 fit 時的 loaders.read_csv 相同不做清理（保留全空列與 Unnamed 欄位）。
+        # 每塊各自推斷型別：類別表為文字的 onehot 欄位一律以文字讀入，
+        # 否則某塊全是數字（"100"）時會被讀成整數而對不上類別表
+        # 讀到一半才發現編碼不對時改用下一個編碼，從第一塊重新寫出
+        from streaming import ENCODINGS, encoding_candidates
+        for enc in encoding_candidates(source, encoding):
+            try:
+                return self._transform_chunks(source, output, chunksize, enc, progress)
+            except UnicodeDecodeError:
+                if hasattr(output, "seek"):
+                    output.seek(0)
+                    output.truncate()
+        raise ValueError(f"{getattr(source, 'name', 'CSV')}: 無法以 {', '.join(ENCODINGS)} 讀取")
+
+    def _transform_chunks(self, source, output, chunksize, encoding, progress):
+        from streaming import iter_csv_chunks
+        text_cols = [step["variable"] for step in self.steps
+                     if step["kind"] == "onehot" and any(isinstance(v, str) for v in step["values"])]
+        rows = 0
+        chunks = iter_csv_chunks(source, chunksize=chunksize, encoding=encoding, categorical_cols=text_cols, clean=False)
+        for i, chunk in enumerate(chunks):
+            export_csv(self.transform(chunk), output, header=i == 0, append=i > 0)
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+        return rows
+
+    def to_dict(self):
+        return {"version": PIPELINE_VERSION, "steps": self.steps, "columns": self.columns,
+                "inputs": self.inputs, "code": self.code, "variable_names": self.variable_names}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != PIPELINE_VERSION:
+            raise ValueError(f"不支援的轉換器版本：{data.get('version')}")
+        pipeline = cls()
+        pipeline.steps = data["steps"]
+        pipeline.columns = data["columns"]
+        pipeline.inputs = data["inputs"]
+        pipeline.code = data["code"]
+        pipeline.variable_names = data["variable_names"]
+        return pipeline
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2, default=str)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls, source):
+        # source 可為路徑或上傳的檔案物件
+        if hasattr(source, "read"):
+            source.seek(0)
+            text = source.read()
+            return cls.from_json(text.decode("utf-8") if isinstance(text, bytes) else text)
+        with open(source, encoding="utf-8") as f:
+            return cls.from_json(f.read())
+
+
+def to_dense(df):
+    # sparse one-hot 欄位轉回一般 uint8 欄位（預覽或匯出一小段時使用）；
+    # 全部填進同一個 uint8 矩陣，to_csv 處理一整塊比逐欄快得多
+    sparse = [col for col in df.columns if df[col].dtype == SPARSE_DTYPE]
+    if not sparse:
+        return df
+    block = np.zeros((len(df), len(sparse)), dtype=np.uint8)
+    for j, col in enumerate(sparse):
+        values = df[col].array
+        block[values.sp_index.indices, j] = values.sp_values
+    dense = pd.DataFrame(block, index=df.index, columns=sparse)
+    return pd.concat([df.drop(columns=sparse), dense], axis=1)[list(df.columns)]
+
+
+def export_csv(df, output, header=True, append=False):
+    # 分段匯出 CSV：每段只把有限的列數轉成稠密格式，sparse 欄位不會一次展開；
+    # output 可為路徑或二進位檔案物件，第一段（非附加時）寫入 UTF-8 BOM 方便 Excel 開啟
+    rows = max(1, EXPORT_CELLS // max(1, df.shape[1]))
+    for start in range(0, max(len(df), 1), rows):
+        first = start == 0 and not append
+        to_dense(df.iloc[start:start + rows]).to_csv(
+            output, index=False, header=header and start == 0, mode="a" if not first else "w",
+            encoding="utf-8-sig" if first else "utf-8",
+        )
+
+
+def apply_plan(df, plan):
+    # 回傳 {"df": 轉換後資料, "code": 新的 code 表（list of dict）, "variable_names": 新欄位 → 原欄位,
+    #       "warnings": [...], "pipeline": 學好參數的 TransformPipeline}
+    pipeline = TransformPipeline(plan)
+    out = pipeline.fit_transform(df)
+    return {"df": out, "code": pipeline.code, "variable_names": pipeline.variable_names,
+            "warnings": pipeline.warnings, "pipeline": pipeline}
+
+
+def main(argv=None):
+    # python transforms.py fit reference.csv code.csv pipeline.json
+    # python transforms.py apply pipeline.json new.csv transformed.csv --chunksize 100000
+    parser = argparse.ArgumentParser(description="Tab 2 Transform：學習轉換參數並逐塊套用到新資料")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit = sub.add_parser("fit", help="在參考資料上學習分位數切點與 one-hot 類別，存成 JSON")
+    fit.add_argument("data")
+    fit.add_argument("code")
+    fit.add_argument("pipeline")
+    apply = sub.add_parser("apply", help="以存好的轉換器逐塊轉換新的 CSV")
+    apply.add_argument("pipeline")
+    apply.add_argument("data")
+    apply.add_argument("output")
+    apply.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == "fit":
+        from loaders import read_csv, read_columnar, input_kind
+        code_df = read_csv(args.code)
+        code_df.columns = code_df.columns.str.strip().str.lower()
+        # 與 App Tab 2 相同：CSV 以 read_csv 讀入、不做清理（apply 逐塊讀取時也不清理）
+        kind = input_kind(args.data)
+        df = read_csv(args.data) if kind == "csv" else read_columnar(args.data, kind)
+        pipeline = TransformPipeline(compile_plan(code_df)).fit(df)
+        for message in pipeline.warnings:
+            print(message, file=sys.stderr)
+        pipeline.save(args.pipeline)
+        print(f"{len(pipeline.steps)} transforms, {len(pipeline.columns)} output columns → {args.pipeline}")
+    else:
+        rows = TransformPipeline.load(args.pipeline).transform_csv(args.data, args.output, chunksize=args.chunksize)
+        print(f"{rows:,} rows → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())